@@ -0,0 +1,51 @@
+from array import array
+
+try:
+    import numpy as np
+
+    _ndarray = np.ndarray
+except ImportError:
+    np = None
+    _ndarray = None
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+# Packs entries into the most compact buffer that holds them exactly:
+# array('q') for machine-sized ints, array('d') for floats, otherwise a flat list.
+def make_buffer(values):
+    values = values if type(values) == list else list(values)
+    if not values:
+        return values
+
+    if all(type(v) == int for v in values):
+        if INT64_MIN <= min(values) and max(values) <= INT64_MAX:
+            return array("q", values)
+    elif all(type(v) == float for v in values):
+        return array("d", values)
+
+    return values
+
+
+# ndarrays for a and b if numpy is installed, at least one of them is already an ndarray, and both convert to
+# a dtype of the given kinds ("i" int64, "f" float64). Lists only convert exactly as ints, so for lists
+# (mixed ints and floats, say) "f" is refused. Otherwise None.
+def numpy_pair(a, b, kinds="if"):
+    if np is None or _ndarray not in (type(a), type(b)):
+        return None
+
+    pair = np.asarray(a), np.asarray(b)
+    for x, source in zip(pair, (a, b)):
+        if x.dtype.kind not in kinds or x.dtype.kind == "f" and type(source) == list:
+            return None
+
+    return pair
+
+
+# Largest absolute entry of an int ndarray, used to rule out int64 overflow before vectorizing.
+# Float arrays can't wrap around, so they count as 0.
+def abs_bound(a):
+    if a.dtype.kind == "f":
+        return 0
+    return max(-int(a.min()), int(a.max())) if a.size else 0
@@ -1,3 +1,23 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from heapq import merge, nlargest, nsmallest
+from itertools import islice, repeat
+from multiprocessing.shared_memory import SharedMemory
+from operator import itemgetter
+from random import sample
+from tempfile import TemporaryFile
+
+from buffers import make_buffer
+
+HYBRID_MIN_RUN = 128  # Shorter runs are extended by binary insertion, whose shifts are C memmoves
+
+EXTERNAL_SORT_MEMORY = 256 << 20  # Default memory budget of external_sort, in bytes
+EXTERNAL_SORT_ENTRY_BYTES = 40  # Rough cost of one number held in a Python list (pointer and object)
+
+PARALLEL_SORT_THRESHOLD = 1 << 17  # parallel_sort sorts shorter inputs serially, below the pool's startup cost
+
+
 def selection_sort(arr):
     i = 0
     while i < len(arr):
@@ -25,60 +45,346 @@ def insertion_sort(arr):
         i += 1
 
 
+# Returns a sorted copy of arr (see hybrid_sort)
 def merge_sort(arr):
-    def merge(a, b):
-        result = []
-
-        i = 0
-        j = 0
-        len_a = len(a)
-        len_b = len(b)
-        while i < len_a and j < len_b:
-            if a[i] <= b[j]:
-                result.append(a[i])
-                i += 1
-            else:
-                result.append(b[j])
-                j += 1
+    result = list(arr)
+    hybrid_sort(result)
+    return result
 
-        result += a[i:]
-        result += b[j:]
 
-        return result
+# Stable in-place sort of a list, like list.sort(key=key, reverse=reverse).
+# Finds natural ascending and strictly descending runs, extends short runs to HYBRID_MIN_RUN with binary
+# insertion sort, then merges runs pairwise bottom-up through one auxiliary buffer.
+def hybrid_sort(arr, key=None, reverse=False):
+    if reverse:
+        arr.reverse()  # Reversing before and after keeps equal elements in their original order
 
-    len_arr = len(arr)
-    if len_arr <= 1:
-        return arr
+    if key is None:
+        _hybrid_sort(arr)
+    else:
+        # (key, index, value): keys are compared once each and the index keeps the sort stable
+        decorated = [(key(v), i, v) for i, v in enumerate(arr)]
+        _hybrid_sort(decorated)
+        arr[:] = [t[2] for t in decorated]
 
-    left = arr[:len_arr // 2]
-    right = arr[len_arr // 2:]
+    if reverse:
+        arr.reverse()
 
-    left = merge_sort(left)
-    right = merge_sort(right)
 
-    return merge(left, right)
+def _hybrid_sort(a):
+    n = len(a)
+    if n < 2:
+        return
 
+    bounds = [0]
+    lo = 0
+    while lo < n:
+        hi = _natural_run(a, lo, n)
+        if hi - lo < HYBRID_MIN_RUN:
+            end = min(lo + HYBRID_MIN_RUN, n)
+            _insertion_sort(a, lo, hi, end)
+            hi = end
+        bounds.append(hi)
+        lo = hi
 
-def first_n_smallest(arr, n):
-    first = []
+    buf = [None] * n
+    while len(bounds) > 2:
+        merged = [0]
+        for t in range(0, len(bounds) - 2, 2):
+            _merge(a, bounds[t], bounds[t + 1], bounds[t + 2], buf)
+            merged.append(bounds[t + 2])
+        if len(bounds) % 2 == 0:  # Odd number of runs: the last waits for the next pass
+            merged.append(n)
+        bounds = merged
 
-    i = 0
-    while i < len(arr):
-        j = 0
-        while j < n and j < len(first) and first[j] < arr[i]:  # Linear search for correct position
+
+# End of the run starting at lo, reversing it in place if it is strictly descending
+def _natural_run(a, lo, n):
+    hi = lo + 1
+    if hi == n:
+        return hi
+
+    if a[hi] < a[lo]:
+        while hi + 1 < n and a[hi + 1] < a[hi]:
+            hi += 1
+        hi += 1
+        a[lo:hi] = a[lo:hi][::-1]
+    else:
+        while hi + 1 < n and not a[hi + 1] < a[hi]:
+            hi += 1
+        hi += 1
+
+    return hi
+
+
+# Binary insertion sort of a[lo:end], given a[lo:sorted_end] is already sorted
+def _insertion_sort(a, lo, sorted_end, end):
+    for i in range(sorted_end, end):
+        x = a[i]
+        pos = bisect_right(a, x, lo, i)
+        if pos < i:
+            a[pos + 1:i + 1] = a[pos:i]
+            a[pos] = x
+
+
+# Merges the sorted runs a[lo:mid] and a[mid:hi], copying only the part of the left run that has to move
+def _merge(a, lo, mid, hi, buf):
+    if not a[mid] < a[mid - 1]:
+        return
+
+    # Left entries <= a[mid] and right entries >= a[mid - 1] are already in place
+    lo = bisect_right(a, a[mid], lo, mid)
+    hi = bisect_left(a, a[mid - 1], mid, hi)
+
+    n = mid - lo
+    buf[:n] = a[lo:mid]
+    i, j, k = 0, mid, lo
+    x, y = buf[0], a[mid]
+    while True:
+        if y < x:
+            a[k] = y
+            k += 1
             j += 1
+            if j == hi:
+                break
+            y = a[j]
+        else:
+            a[k] = x
+            k += 1
+            i += 1
+            if i == n:
+                return
+            x = buf[i]
 
-        if j < n:
-            if len(first) < n:  # Expand list if less than first n
-                first.append(None)
+    a[k:hi] = buf[i:n]
 
-            k = len(first) - 1  # Insertion part of insterion sort
-            while k > j:
-                first[k] = first[k - 1]
-                k -= 1
 
-            first[k] = arr[i]  # End insertion
+# The n smallest elements of arr in sorted order; equal elements keep their order in arr.
+# method "heap" makes one pass over any iterable (a generator works) keeping a bounded max-heap of n entries,
+# O(len * log n). method "select" copies arr and partitions around random pivots (quickselect, switching to
+# a full sort if partitioning degrades), O(len) on average, then sorts the n it keeps.
+def first_n_smallest(arr, n, key=None, method="heap"):
+    return _first_n(arr, n, key, method, largest=False)
+
+
+# The n largest elements of arr, largest first; equal elements keep their order in arr
+def first_n_largest(arr, n, key=None, method="heap"):
+    return _first_n(arr, n, key, method, largest=True)
+
+
+def _first_n(arr, n, key, method, largest):
+    if n <= 0:
+        return []
+
+    if method == "heap":
+        return nlargest(n, arr, key) if largest else nsmallest(n, arr, key)
+
+    if method != "select":
+        raise ValueError("Unknown method: {}".format(method))
+
+    values = list(arr)
+    keys = values if key is None else [key(v) for v in values]
+    if n < len(values):
+        # Keep everything strictly before the n-th key, then enough entries equal to it, in arr's order
+        nth = _nth_key(list(keys), n, largest)
+        if largest:
+            chosen = [(k, v) for k, v in zip(keys, values) if k > nth]
+        else:
+            chosen = [(k, v) for k, v in zip(keys, values) if k < nth]
+        chosen += [(k, v) for k, v in zip(keys, values) if k == nth][:n - len(chosen)]
+    else:
+        chosen = list(zip(keys, values))
+
+    hybrid_sort(chosen, key=itemgetter(0), reverse=largest)
+    return [v for _, v in chosen]
+
+
+# The n-th smallest (or largest) of keys, by quickselect on three-way partitions around random pivots.
+# Falls back to sorting if the partitions keep coming out lopsided.
+def _nth_key(keys, n, largest):
+    depth = 2 * len(keys).bit_length()
+    while depth:
+        depth -= 1
+        pivot = sorted(sample(keys, 3))[1] if len(keys) >= 3 else keys[0]
+        if largest:
+            before = [k for k in keys if k > pivot]
+        else:
+            before = [k for k in keys if k < pivot]
+
+        if n <= len(before):
+            keys = before
+            continue
+
+        n -= len(before) + keys.count(pivot)
+        if n <= 0:
+            return pivot
+
+        if largest:
+            keys = [k for k in keys if k < pivot]
+        else:
+            keys = [k for k in keys if k > pivot]
+
+    hybrid_sort(keys, reverse=largest)
+    return keys[n - 1]
+
+
+# Sorts numbers that needn't fit in memory, yielding them in order.
+# source: any iterable of numbers, or a path to (or binary file object of) a dump of packed values in the
+# array module's native `typecode` format.
+# typecode: the array typecode values are stored and yielded as. By default "q" if the first chunk is all
+# machine ints and "d" if it is all floats ("d" for dumps). Values it can't hold exactly raise ValueError.
+# Chunks of about memory_budget bytes are sorted in memory and spilled to temporary files in temp_dir as
+# packed `typecode` values; the sorted runs are then k-way merged through a heap, reading each in blocks.
+def external_sort(source, typecode=None, memory_budget=None, temp_dir=None, reverse=False):
+    budget = memory_budget or EXTERNAL_SORT_MEMORY
+    chunk_len = max(1, budget // EXTERNAL_SORT_ENTRY_BYTES)
+    if typecode is None and (type(source) == str or hasattr(source, "readinto")):
+        typecode = "d"
+
+    runs = []
+    try:
+        for chunk in _read_chunks(source, typecode or "d", chunk_len):
+            chunk.sort(reverse=reverse)
+            if typecode is None:
+                packed = make_buffer(chunk)
+                if type(packed) != array:
+                    raise ValueError("external_sort needs all machine ints or all floats without a typecode")
+                typecode = packed.typecode
+            else:
+                packed = _pack_exact(chunk, typecode)
+            del chunk
+
+            if not runs and len(packed) < chunk_len:  # Everything fit in one chunk
+                yield from packed
+                return
+
+            f = TemporaryFile(dir=temp_dir)
+            packed.tofile(f)
+            runs.append(f)
+            del packed
+
+        # Half the budget is left for read blocks, split between the runs
+        block_len = max(1, budget // (2 * len(runs) * array(typecode).itemsize)) if runs else 1
+        yield from merge(*[_read_run(f, typecode, block_len) for f in runs], reverse=reverse)
+    finally:
+        for f in runs:
+            f.close()
+
+
+# values as array(typecode), raising ValueError for any value it can't hold exactly
+def _pack_exact(values, typecode):
+    try:
+        packed = array(typecode, values)
+    except (TypeError, OverflowError):
+        packed = None
+
+    # NaNs are the only values allowed to compare unequal to themselves
+    if packed is None or packed.tolist() != values and any(v != w and v == v for v, w in zip(values, packed)):
+        raise ValueError("Values don't all fit typecode {!r} exactly".format(typecode))
+    return packed
+
+
+# Lists of at most chunk_len numbers from an iterable, a dump file path or a binary file object
+def _read_chunks(source, typecode, chunk_len):
+    if type(source) == str:
+        with open(source, "rb") as f:
+            yield from _read_chunks(f, typecode, chunk_len)
+        return
+
+    if hasattr(source, "readinto"):
+        for block in _read_blocks(source, typecode, chunk_len):
+            yield block.tolist()
+        return
+
+    it = iter(source)
+    while True:
+        chunk = list(islice(it, chunk_len))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_run(f, typecode, block_len):
+    f.seek(0)
+    for block in _read_blocks(f, typecode, block_len):
+        yield from block
+
+
+# Arrays of up to block_len packed values read from f until it ends
+def _read_blocks(f, typecode, block_len):
+    while True:
+        block = array(typecode)
+        try:
+            block.fromfile(f, block_len)
+        except EOFError:  # Short final block; fromfile keeps what it did read
+            if block:
+                yield block
+            return
+        yield block
+
+
+# Returns a sorted list of arr's elements, like sorted(arr, key=key, reverse=reverse), sorting contiguous
+# partitions on a pool of worker processes.
+# Machine ints and floats are passed through one shared memory buffer which the workers sort in place, so the
+# input isn't pickled. Other values are pickled to the workers; with a key, keys are computed here and sent
+# as (key, +-index) pairs, so the key function needn't be picklable and ties keep their order.
+# The sorted partitions are merged by list.sort, whose run detection makes it a galloping k-way merge in C.
+def parallel_sort(arr, workers=1, key=None, reverse=False):
+    values = arr if type(arr) == list else list(arr)
+    n = len(values)
+    if workers <= 1 or n < PARALLEL_SORT_THRESHOLD:
+        return sorted(values, key=key, reverse=reverse)
+
+    if key is not None:
+        sign = -1 if reverse else 1
+        order = parallel_sort([(k, sign * i) for i, k in enumerate(map(key, values))], workers, None, reverse)
+        return [values[sign * i] for _, i in order]
+
+    step = -(-n // workers)
+    starts = range(0, n, step)
+    stops = [min(lo + step, n) for lo in starts]
+
+    packed = make_buffer(values)
+    with ProcessPoolExecutor(workers) as pool:
+        if type(packed) != array:
+            runs = list(pool.map(_sorted_part, [values[lo:hi] for lo, hi in zip(starts, stops)], repeat(reverse)))
+        else:
+            typecode = packed.typecode
+            shm = SharedMemory(create=True, size=n * packed.itemsize)
+            try:
+                buf = shm.buf.cast(typecode)
+                try:
+                    buf[:] = packed
+                    del packed
+                    list(pool.map(_sort_shared, repeat(shm.name), repeat(typecode), starts, stops, repeat(reverse)))
+                    runs = [buf[lo:hi].tolist() for lo, hi in zip(starts, stops)]
+                finally:
+                    buf.release()
+            finally:
+                shm.close()
+                shm.unlink()
+
+    result = []
+    for run in runs:
+        result.extend(run)
+    result.sort(reverse=reverse)
+    return result
+
+
+# Process pool tasks, at module level so workers can unpickle them
+def _sorted_part(values, reverse):
+    values.sort(reverse=reverse)
+    return values
 
-        i += 1
 
-    return first
+# Sorts buf[lo:hi] of the named shared memory block in place
+def _sort_shared(name, typecode, lo, hi, reverse):
+    shm = SharedMemory(name=name)
+    try:
+        buf = shm.buf.cast(typecode)
+        try:
+            buf[lo:hi] = array(typecode, sorted(buf[lo:hi].tolist(), reverse=reverse))
+        finally:
+            buf.release()
+    finally:
+        shm.close()
@@ -1,20 +1,406 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from itertools import repeat
 from math import sqrt
+from operator import add, mul, sub
 
-import matrix_functions as mf
+try:
+    import numpy as np
+
+    _ndarray = np.ndarray
+except ImportError:
+    np = None
+    _ndarray = None
+
+from buffers import INT64_MAX, abs_bound, make_buffer, numpy_pair
+
+MUL_BLOCK_SIZE = 64  # Columns of the right operand kept hot while sweeping the rows of the left
+PARALLEL_MUL_THRESHOLD = 200 ** 3  # Multiply-adds below which a process pool costs more than it saves
+STRASSEN_CROSSOVER = 64  # Exact square products at least this big use Strassen-Winograd recursion down to it
+NUMPY_AUTO_MIN_ENTRIES = 256  # Typed matrices at least this big move to numpy when no backend is given
+LU_FLOAT_EPS = 2.0 ** -52  # Float pivots within LU_FLOAT_EPS * size * largest entry of zero count as zero
+
+
+# Python type of the entries a typed buffer holds, or None for a list buffer
+def _entry_type(data):
+    if type(data) == array:
+        return int if data.typecode == "q" else float
+    if type(data) == _ndarray:
+        return int if data.dtype.kind == "i" else float
+    return None
+
+
+# Returns values packed to match the buffer's type, or None if they don't fit it
+def _pack_like(data, values):
+    entry_type = _entry_type(data)
+    if entry_type is None:
+        return list(values)
+
+    values = list(values)
+    if not all(type(v) == entry_type for v in values):
+        return None
+
+    try:
+        return array(data.typecode, values) if type(data) == array else np.array(values, dtype=data.dtype)
+    except OverflowError:
+        return None
+
+
+# Zero-copy ndarray view of a typed buffer
+def _as_ndarray(data):
+    if type(data) == array:
+        return np.frombuffer(data, dtype=np.int64 if data.typecode == "q" else np.float64)
+    return data
+
+
+# Moves a buffer to the given backend, sharing memory where the layouts allow it.
+# With no backend, large typed buffers go to numpy when it is installed.
+def _convert_buffer(data, backend):
+    if backend is None:
+        if type(data) == _ndarray:
+            return data
+        backend = "numpy" if np is not None and type(data) == array and len(data) >= NUMPY_AUTO_MIN_ENTRIES \
+            else "python"
+
+    if backend == "numpy":
+        if np is None:
+            raise ImportError("The numpy Matrix backend requires numpy to be installed")
+
+        if type(data) == list and data and all(type(v) in (int, float) for v in data) and float in map(type, data):
+            return np.array(data, dtype=np.float64)
+
+        # Big ints and Fractions stay on Python to remain exact
+        return data if type(data) == list else _as_ndarray(data)
+
+    if backend == "python":
+        if type(data) == _ndarray:
+            return array("q" if data.dtype.kind == "i" else "d", data.tobytes())
+        return data
+
+    raise ValueError("Unknown Matrix backend: {}".format(backend))
+
+
+# Whether two buffers could see each other's writes
+def _shares_memory(a, b):
+    if a is b:
+        return True
+    if _ndarray is None or type(a) == list or type(b) == list:
+        return False
+    return bool(np.shares_memory(_as_ndarray(a), _as_ndarray(b)))
+
+
+# Multiplies the row-major rows in a (n entries each) by the p columns stored row-major in bt.
+# Module level so process pool workers can unpickle it.
+def _mul_rows(a, bt, n, p):
+    a_rows = [a[r:r + n] for r in range(0, len(a), n)]
+    b_cols = [bt[c:c + n] for c in range(0, len(bt), n)]
+
+    out = [0] * (len(a_rows) * p)
+    for jj in range(0, p, MUL_BLOCK_SIZE):
+        tile = b_cols[jj:jj + MUL_BLOCK_SIZE]
+        for i, row in enumerate(a_rows):
+            base = i * p + jj
+            for j, col in enumerate(tile):
+                out[base + j] = sum(map(mul, row, col))
+
+    return out
+
+
+# Strassen-Winograd product of two n x n matrices given as row lists: 7 half-size products per level
+# instead of 8. Odd sizes are padded with a zero row and column.
+def _strassen(a, b, crossover):
+    n = len(a)
+    if n <= crossover:
+        b_cols = list(zip(*b))
+        return [[sum(map(mul, row, col)) for col in b_cols] for row in a]
+
+    if n % 2:
+        a = [r + [0] for r in a] + [[0] * (n + 1)]
+        b = [r + [0] for r in b] + [[0] * (n + 1)]
+        return [r[:n] for r in _strassen(a, b, crossover)[:n]]
+
+    h = n // 2
+    a11, a12 = [r[:h] for r in a[:h]], [r[h:] for r in a[:h]]
+    a21, a22 = [r[:h] for r in a[h:]], [r[h:] for r in a[h:]]
+    b11, b12 = [r[:h] for r in b[:h]], [r[h:] for r in b[:h]]
+    b21, b22 = [r[:h] for r in b[h:]], [r[h:] for r in b[h:]]
+
+    s1 = _add_blocks(a21, a22)
+    s2 = _sub_blocks(s1, a11)
+    s3 = _sub_blocks(a11, a21)
+    s4 = _sub_blocks(a12, s2)
+    t1 = _sub_blocks(b12, b11)
+    t2 = _sub_blocks(b22, t1)
+    t3 = _sub_blocks(b22, b12)
+    t4 = _sub_blocks(t2, b21)
+
+    m1 = _strassen(a11, b11, crossover)
+    m2 = _strassen(a12, b21, crossover)
+    m3 = _strassen(s4, b22, crossover)
+    m4 = _strassen(a22, t4, crossover)
+    m5 = _strassen(s1, t1, crossover)
+    m6 = _strassen(s2, t2, crossover)
+    m7 = _strassen(s3, t3, crossover)
+
+    u2 = _add_blocks(m1, m6)
+    u3 = _add_blocks(u2, m7)
+    u4 = _add_blocks(u2, m5)
+    c11 = _add_blocks(m1, m2)
+    c12 = _add_blocks(u4, m3)
+    c21 = _sub_blocks(u3, m4)
+    c22 = _add_blocks(u3, m5)
+
+    return [r1 + r2 for r1, r2 in zip(c11, c12)] + [r1 + r2 for r1, r2 in zip(c21, c22)]
+
+
+def _add_blocks(x, y):
+    return [list(map(add, r1, r2)) for r1, r2 in zip(x, y)]
+
+
+def _sub_blocks(x, y):
+    return [list(map(sub, r1, r2)) for r1, r2 in zip(x, y)]
+
+
+def _row_offsets(num_rows, num_cols):
+    return list(range(0, num_rows * num_cols, num_cols)) if num_cols else [0] * num_rows
+
+
+# Entries of a buffer as Python scalars
+def _scalars(data):
+    return data.tolist() if type(data) == _ndarray else data
+
+
+# Results computed from the entries of a buffer, packed like it when they all fit its typecode,
+# otherwise through make_buffer
+def _pack_results(values, like):
+    if type(like) == array:
+        try:
+            return array(like.typecode, values)
+        except (OverflowError, TypeError):
+            pass  # A result outgrew int64, or isn't a machine int
+
+    return make_buffer(values)
 
 
 class Matrix:
-    def __init__(self, rows):
-        self.rows = list(rows)
+    # Entries live in one flat row-major buffer. Logical row i starts at _offsets[i],
+    # so row swaps and sorts only permute the offset table.
+    # A buffer shared with another Matrix or ndarray (_shared) is copied before the first write to it.
+    __slots__ = ("_data", "_offsets", "num_rows", "num_cols", "_lu", "_shared")
+
+    def __init__(self, rows, backend=None):
+        # backend: "python", "numpy", or None to pick numpy for large float and machine-int matrices
+        rows = list(rows)
+
+        self.num_rows = len(rows)
+        self.num_cols = len(rows[0])
+
+        values = [e for r in rows for e in r]
+        if len(values) != self.num_rows * self.num_cols:
+            raise ValueError("All rows of a Matrix must have the same length")
+
+        self._data = _convert_buffer(make_buffer(values), backend)
+        self._offsets = _row_offsets(self.num_rows, self.num_cols)
+        self._lu = None
+        self._shared = False
+
+    @classmethod
+    def _from_flat(cls, data, num_rows, num_cols):
+        # Wraps a row-major buffer without copying it
+        m = cls.__new__(cls)
+        m._data = data
+        m.num_rows = num_rows
+        m.num_cols = num_cols
+        m._offsets = _row_offsets(num_rows, num_cols)
+        m._lu = None
+        m._shared = type(data) == _ndarray and data.base is not None  # A view may be visible elsewhere
+        return m
+
+    @classmethod
+    def from_numpy(cls, a):
+        # Wraps a 2-D ndarray, sharing its memory when it is already contiguous float64/int64
+        a = np.asarray(a)
+        if a.ndim != 2:
+            raise ValueError("Expected a 2-D array, got {} dimensions".format(a.ndim))
+
+        if a.dtype.kind == "f":
+            data = np.ascontiguousarray(a, dtype=np.float64).ravel()
+        elif a.dtype.kind in "iu" and np.can_cast(a.dtype, np.int64):
+            data = np.ascontiguousarray(a, dtype=np.int64).ravel()
+        else:
+            data = make_buffer(a.ravel().tolist())
+
+        return cls._from_flat(data, a.shape[0], a.shape[1])
+
+    @property
+    def backend(self):
+        return "numpy" if type(self._data) == _ndarray else "python"
+
+    def to_backend(self, backend):
+        # Shares the buffer where the layouts allow it, copying on the first write to either matrix
+        m = Matrix._from_flat(_convert_buffer(self.flat(), backend), self.num_rows, self.num_cols)
+        if _shares_memory(m._data, self._data):
+            self._shared = m._shared = True
+        return m
+
+    def to_numpy(self):
+        # Entries as a 2-D ndarray. Shares memory with typed buffers whose rows are stored in order;
+        # the matrix then copies its buffer before writing to it again.
+        flat = self.flat()
+        if type(flat) == list:
+            flat = np.array(flat)
+        a = _as_ndarray(flat).reshape(self.num_rows, self.num_cols)
+        if _shares_memory(a, self._data):
+            self._shared = True
+        return a
+
+    @property
+    def rows(self):
+        return _RowsView(self)
+
+    @rows.setter
+    def rows(self, rows):
+        self.__init__(rows)
+
+    def row(self, i):
+        return _RowView(self, self._offsets[i])
+
+    def col(self, j):
+        return _ColumnView(self, j)
+
+    def flat(self):
+        # Entries in row-major order. Shares the buffer when rows are stored in order.
+        c = self.num_cols
+        if self._is_contiguous():
+            return self._data
+
+        data = self._data
+        if type(data) == _ndarray:
+            return data[np.add.outer(self._offsets, np.arange(c)).ravel()]
+
+        flat = [] if type(data) == list else array(data.typecode)
+        for o in self._offsets:
+            flat += data[o:o + c]
+        return flat
+
+    def _is_contiguous(self):
+        return len(self._data) == self.num_rows * self.num_cols and \
+            self._offsets == _row_offsets(self.num_rows, self.num_cols)
 
-        self.num_rows = len(self.rows)
-        self.num_cols = len(self.rows[0])
+    def copy(self):
+        # Copies the buffer in row order. Entries are immutable numbers, so this is also a deep copy,
+        # and much cheaper than deepcopy's per-object walk.
+        flat = self.flat()
+        m = type(self)._from_flat(flat.copy() if type(flat) == _ndarray else flat[:], self.num_rows, self.num_cols)
+        m._lu = self._lu
+        return m
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def _replace_with(self, other):
+        # Takes over other's storage (and shape), for in-place operations that can't reuse the buffer
+        self._data, self._offsets = other._data, other._offsets
+        self.num_rows, self.num_cols = other.num_rows, other.num_cols
+        self._lu = None
+        self._shared = other._shared
+
+    def _own(self):
+        # Called before writing to the buffer: takes a private copy if it is shared
+        self._lu = None
+        if self._shared:
+            self._data = self._data.copy() if type(self._data) == _ndarray else self._data[:]
+            self._shared = False
+
+    def _assign_flat(self, values):
+        # Writes row-major values back through the row table, promoting the buffer only when they don't fit it
+        self._own()
+        packed = _pack_like(self._data, values)
+        if packed is None:
+            self._data = self._data.tolist()
+            packed = list(values)
+
+        c = self.num_cols
+        if self._is_contiguous():
+            self._data[:] = packed
+        else:
+            for i, o in enumerate(self._offsets):
+                self._data[o:o + c] = packed[i * c:(i + 1) * c]
+
+    def _values(self):
+        # Row-major entries as Python scalars, for the exact pure-Python paths
+        flat = self.flat()
+        return flat.tolist() if type(flat) == _ndarray else flat
+
+    def compact(self):
+        # Re-packs the buffer in row order, dropping orphaned rows and narrowing its type where possible
+        flat = self.flat()
+        self._data = np.array(flat) if type(flat) == _ndarray else make_buffer(flat)
+        self._offsets = _row_offsets(self.num_rows, self.num_cols)
+
+    def _get(self, index):
+        e = self._data[index]
+        return e.item() if type(self._data) == _ndarray else e
+
+    def lu(self):
+        # PLU decomposition, computed once and reused until the matrix is modified
+        if self._lu is None:
+            self._lu = LUDecomposition(self)
+        return self._lu
+
+    def _set(self, index, value):
+        self._own()
+        data = self._data
+        entry_type = _entry_type(data)
+        if entry_type is not None:
+            if type(value) == entry_type:
+                try:
+                    data[index] = value
+                    return
+                except OverflowError:
+                    pass
+
+            # Entry no longer fits the typed buffer
+            self._data = data = data.tolist()
+
+        data[index] = value
+
+    def _set_row(self, offset, values):
+        self._own()
+        packed = _pack_like(self._data, values)
+        if packed is None:
+            self._data = self._data.tolist()
+            packed = list(values)
+
+        if len(packed) != self.num_cols:
+            raise ValueError("Row must have {} entries, got {}".format(self.num_cols, len(packed)))
+
+        self._data[offset:offset + self.num_cols] = packed
+
+    def _replace_row(self, i, values):
+        # Rebinds logical row i to new values, leaving rows aliased to it untouched
+        offset = self._offsets[i]
+        if self._offsets.count(offset) > 1:
+            self._offsets[i] = offset = len(self._data)
+            self._own()
+            if type(self._data) == _ndarray:
+                self._data = np.concatenate((self._data, np.zeros(self.num_cols, self._data.dtype)))
+            else:
+                self._data.extend([0] * self.num_cols)
+
+        self._set_row(offset, values)
 
     def __mul__(self, other):
         if type(other) == Matrix:
             return self.matrix_mul(other)
         if type(other) in [int, float]:
             return self.scalar_mul(other)
+        if type(other) == SparseMatrix:
+            # A * S = (S^T * A^T)^T keeps the work on the sparse side
+            return other.transpose().matrix_mul(self.transpose()).transpose()
 
         raise TypeError("Multiplication unsupported for types: {} and {}".format(type(self), type(other)))
 
@@ -24,86 +410,512 @@ class Matrix:
                 "Can't add matrices of differing dimensions: {}x{} and {}x{}".format(self.num_rows, self.num_cols,
                                                                                      other.num_rows, other.num_cols))
 
-        new_rows = [[self.rows[i][j] + other.rows[i][j] for j in range(self.num_cols)] for i in range(self.num_rows)]
-        return Matrix(new_rows)
+        if type(other) == SparseMatrix:
+            return other + self
+
+        a, b = self.flat(), other.flat()
+        pair = numpy_pair(a, b)
+        if pair is not None and abs_bound(pair[0]) + abs_bound(pair[1]) <= INT64_MAX:
+            return Matrix._from_flat(pair[0] + pair[1], self.num_rows, self.num_cols)
+
+        return Matrix._from_flat(_pack_results(list(map(add, _scalars(a), _scalars(b))), a), self.num_rows,
+                                 self.num_cols)
 
     def __repr__(self):
+        rows = [r.tolist() for r in self.rows]
         max_num_size = 0
-        for row in self.rows:
+        for row in rows:
             for entry in row:
                 l = len(str(entry))
                 if l > max_num_size:
                     max_num_size = l
 
-        num_format = lambda n: "{:>{}}".format(n, max_num_size)
+        num_format = lambda n: "{:>{}}".format(str(n), max_num_size)
+
+        return "\n".join("  ".join(list(map(num_format, r))) for r in rows)
+
+    def add_scaled(self, other, s=1):
+        # self += s * other in place (axpy), without building s * other
+        if self.num_rows != other.num_rows or self.num_cols != other.num_cols:
+            raise ArithmeticError(
+                "Can't add matrices of differing dimensions: {}x{} and {}x{}".format(self.num_rows, self.num_cols,
+                                                                                     other.num_rows, other.num_cols))
+
+        if type(other) == SparseMatrix:
+            for i in range(other.num_rows):
+                base = self._offsets[i]
+                for j, v in other.row_items(i):
+                    self._set(base + j, self._get(base + j) + s * v)
+            return self
+
+        if not self._add_scaled_numpy(other, s):
+            if s == 1:
+                self._assign_flat(list(map(add, self._values(), other._values())))
+            else:
+                self._assign_flat([a + s * b for a, b in zip(self._values(), other._values())])
+
+        return self
+
+    def _add_scaled_numpy(self, other, s):
+        # add_scaled within the ndarray buffer. Returns False when that can't be done exactly.
+        data = self._data
+        if type(data) != _ndarray or type(s) not in (int, float) or _entry_type(other.flat()) is None:
+            return False
+
+        o = _as_ndarray(other.flat())
+        if data.dtype.kind == "i" and (o.dtype.kind != "i" or type(s) != int or
+                                       abs_bound(data) + abs(s) * abs_bound(o) > INT64_MAX):
+            return False
+
+        self._own()
+        data = self._data
+        if self._is_contiguous():
+            data += o * s if s != 1 else o
+        else:
+            data[np.add.outer(self._offsets, np.arange(self.num_cols)).ravel()] += o * s
+        return True
+
+    def __iadd__(self, other):
+        return self.add_scaled(other)
+
+    def __imul__(self, other):
+        # Scalars scale the buffer in place; a matrix product replaces the storage
+        if type(other) in [int, float]:
+            data = self._data
+            if type(data) == _ndarray and (data.dtype.kind == "f" or type(other) == int and abs(other) <= INT64_MAX and
+                                           abs_bound(data) * abs(other) <= INT64_MAX):
+                self._own()
+                self._data *= other
+            else:
+                self._assign_flat([e * other for e in self._values()])
+            return self
 
-        return "\n".join("  ".join(list(map(num_format, r))) for r in self.rows)
+        self._replace_with(self * other)
+        return self
 
     def scalar_mul(self, c):
-        new_rows = [[self.rows[i][j] * c for j in range(self.num_cols)] for i in range(self.num_rows)]
-        return Matrix(new_rows)
+        flat = self.flat()
+        if type(flat) == _ndarray and (type(c) == float or type(c) == int and abs(c) <= INT64_MAX and
+                                       abs_bound(flat) * abs(c) <= INT64_MAX):
+            return Matrix._from_flat(flat * c, self.num_rows, self.num_cols)
 
-    def matrix_mul(self, other):
+        return Matrix._from_flat(_pack_results(list(map(mul, _scalars(flat), repeat(c, len(flat)))), flat),
+                                 self.num_rows, self.num_cols)
+
+    def matrix_mul(self, other, workers=1):
+        # Multiplies row by column against a transposed copy of other, in column tiles.
+        # Each entry is still summed left to right, so results match the naive triple loop exactly.
+        # With workers > 1, large products are split into row blocks over a process pool.
         if self.num_cols != other.num_rows:
             raise ArithmeticError(
                 "Can't multiple Matrices: {}x{} and {}x{}".format(self.num_rows, self.num_cols, other.num_rows,
                                                                   other.num_cols))
 
-        new_rows = []
-        for a in range(self.num_rows):
-            new_rows.append([])
-            for b in range(other.num_cols):
-                entry = sum([self.rows[a][i] * other.rows[i][b] for i in range(self.num_cols)])
-                new_rows[a].append(entry)
+        m, n, p = self.num_rows, self.num_cols, other.num_cols
+
+        pair = numpy_pair(self.flat(), other.flat())
+        if pair is not None and abs_bound(pair[0]) * abs_bound(pair[1]) * n <= INT64_MAX:
+            return Matrix._from_flat((pair[0].reshape(m, n) @ pair[1].reshape(n, p)).ravel(), m, p)
+
+        a = list(self._values())
+        bt = list(other.transpose()._values()) if n else []
+
+        if workers > 1 and m > 1 and m * n * p >= PARALLEL_MUL_THRESHOLD:
+            step = -(-m // workers) * n
+            with ProcessPoolExecutor(workers) as pool:
+                blocks = pool.map(_mul_rows, [a[lo:lo + step] for lo in range(0, m * n, step)], repeat(bt),
+                                  repeat(n), repeat(p))
+                new_data = [e for block in blocks for e in block]
+        else:
+            new_data = _mul_rows(a, bt, n, p) if n else [0] * (m * p)
+
+        return Matrix._from_flat(make_buffer(new_data), m, p)
+
+    def strassen_mul(self, other, crossover=None):
+        # Strassen-Winograd product for square matrices, recursing until blocks reach crossover
+        # (STRASSEN_CROSSOVER by default). Exact for ints and Fractions; floats may round differently
+        # from matrix_mul. Other shapes, and the numpy backend, use matrix_mul.
+        n = self.num_rows
+        crossover = STRASSEN_CROSSOVER if crossover is None else max(crossover, 1)
+        if not (n == self.num_cols == other.num_rows == other.num_cols) or n <= crossover or \
+                _ndarray in (type(self._data), type(other._data)):
+            return self.matrix_mul(other)
+
+        a = [r.tolist() for r in self.rows]
+        b = [r.tolist() for r in other.rows]
+        return Matrix._from_flat(make_buffer([e for r in _strassen(a, b, crossover) for e in r]), n, n)
+
+    def __pow__(self, k, mod=None):
+        # Binary exponentiation, O(log k) products. pow(M, k, mod) reduces the entries mod `mod` after
+        # every product, so they never grow past it. Negative powers invert through the LU decomposition.
+        if self.num_rows != self.num_cols:
+            raise ArithmeticError("Can't raise non-square matrix to a power: {}x{}".format(self.num_rows,
+                                                                                           self.num_cols))
+        if type(k) != int:
+            raise TypeError("Matrix powers must be integers, got {}".format(type(k)))
+
+        base = self
+        if k < 0:
+            if mod is not None:
+                raise ArithmeticError("Negative matrix powers aren't supported with a modulus")
+            if self.lu().is_singular():
+                raise ArithmeticError("Singular matrix has no negative powers")
+            base, k = self.lu().inverse(), -k
+
+        if mod is not None:
+            base = base._reduce_mod(mod)
+
+        result = None
+        while k:
+            if k & 1:
+                result = base.copy() if result is None else result._power_step(base, mod)
+            k >>= 1
+            if k:
+                base = base._power_step(base, mod)
+
+        if result is None:
+            result = get_identity_matrix(self.num_rows)
+            if mod is not None:
+                result = result._reduce_mod(mod)
 
-        return Matrix(new_rows)
+        return result
+
+    def _power_step(self, other, mod):
+        # Strassen only where it can't change the result
+        product = self.strassen_mul(other) if self._is_exact() and other._is_exact() else self.matrix_mul(other)
+        return product if mod is None else product._reduce_mod(mod)
+
+    def _is_exact(self):
+        entry_type = _entry_type(self._data)
+        if entry_type is not None:
+            return entry_type == int
+        return not any(type(e) == float for e in self._data)
+
+    def _reduce_mod(self, mod):
+        flat = self.flat()
+        if type(flat) == _ndarray and flat.dtype.kind == "i" and type(mod) == int and 0 < mod <= INT64_MAX:
+            return Matrix._from_flat(flat % mod, self.num_rows, self.num_cols)
+        return Matrix._from_flat(_pack_results([e % mod for e in _scalars(flat)], flat), self.num_rows, self.num_cols)
 
     def transpose(self):
-        return Matrix(list(zip(*self.rows)))
+        if self.backend == "numpy":
+            return Matrix._from_flat(self.to_numpy().T.ravel(), self.num_cols, self.num_rows)
+
+        flat = self.flat()
+        c = self.num_cols
+        new_data = [] if type(flat) == list else array(flat.typecode)
+        for j in range(c):
+            new_data += flat[j::c]
+
+        return Matrix._from_flat(new_data, c, self.num_rows)
 
     def sub_matrix(self, row_rem, col_rem):
         # Returns matrix with given row & column removed
-        return Matrix([[self.rows[i][j] for j in range(self.num_cols) if j != col_rem]
-                       for i in range(self.num_rows) if i != row_rem])
+        if self.backend == "numpy":
+            return Matrix._from_flat(np.delete(np.delete(self.to_numpy(), row_rem, 0), col_rem, 1).ravel(),
+                                     self.num_rows - 1, self.num_cols - 1)
+
+        data = self._data
+        c = self.num_cols
+        new_data = [] if type(data) == list else array(data.typecode)
+        for i, o in enumerate(self._offsets):
+            if i != row_rem:
+                new_data += data[o:o + col_rem]
+                new_data += data[o + col_rem + 1:o + c]
+
+        return Matrix._from_flat(new_data, self.num_rows - 1, c - 1)
 
     def swap_rows(self, i1, i2):
-        self.rows[i1], self.rows[i2] = self.rows[i2], self.rows[i1]
+        self._lu = None
+        self._offsets[i1], self._offsets[i2] = self._offsets[i2], self._offsets[i1]
 
     def scale_row(self, i, s):
-        self.rows[i] = [self.rows[i][j] * s for j in range(self.num_cols)]
-        mf.round_matrix(self)
+        self.rows[i] = [e * s for e in self.row(i)]
 
     def add_row(self, i, k, s=1):
-        self.rows[i] = [self.rows[i][j] + s * self.rows[k][j] for j in range(self.num_cols)]
+        self.rows[i] = [a + s * b for a, b in zip(self.row(i), self.row(k))]
 
     def is_zero(self):
-        for row in self.rows:
-            for entry in row:
-                if entry:
-                    return False
-
-        return True
+        flat = self.flat()
+        return not (flat.any() if type(flat) == _ndarray else any(flat))
 
     def is_identity(self):
         if self.num_rows != self.num_cols:
             return False
 
+        if self.backend == "numpy":
+            return bool((self.to_numpy() == np.eye(self.num_rows)).all())
+
+        flat = self.flat()
+        n = self.num_cols
         for i in range(self.num_rows):
             for j in range(self.num_cols):
-                if i == j and self.rows[i][j] != 1:
+                if i == j and flat[i * n + j] != 1:
                     return False
-                elif i != j and self.rows[i][j] != 0:
+                elif i != j and flat[i * n + j] != 0:
                     return False
 
         return True
 
 
+# Live view of one row of a Matrix's buffer. Behaves like the row lists of the old nested storage.
+class _RowView:
+    __slots__ = ("_matrix", "_offset")
+
+    def __init__(self, matrix, offset):
+        self._matrix = matrix
+        self._offset = offset
+
+    def _index(self, j):
+        n = self._matrix.num_cols
+        if j < 0:
+            j += n
+        if not 0 <= j < n:
+            raise IndexError("row index out of range")
+        return self._offset + j
+
+    def __len__(self):
+        return self._matrix.num_cols
+
+    def __getitem__(self, j):
+        if type(j) == slice:
+            return self.tolist()[j]
+        return self._matrix._get(self._index(j))
+
+    def __setitem__(self, j, value):
+        if type(j) == slice:
+            values = self.tolist()
+            values[j] = value
+            self._matrix._set_row(self._offset, values)
+        else:
+            self._matrix._set(self._index(j), value)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        return self.tolist() == list(other)
+
+    def __lt__(self, other):
+        return self.tolist() < list(other)
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def count(self, value):
+        return self.tolist().count(value)
+
+    def tolist(self):
+        data = self._matrix._data[self._offset:self._offset + self._matrix.num_cols]
+        return data if type(data) == list else data.tolist()
+
+
+# Live view of one column of a Matrix
+class _ColumnView:
+    __slots__ = ("_matrix", "_j")
+
+    def __init__(self, matrix, j):
+        if not -matrix.num_cols <= j < matrix.num_cols:
+            raise IndexError("column index out of range")
+        self._matrix = matrix
+        self._j = j % matrix.num_cols
+
+    def __len__(self):
+        return self._matrix.num_rows
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            return self.tolist()[i]
+        return self._matrix._get(self._matrix._offsets[i] + self._j)
+
+    def __setitem__(self, i, value):
+        self._matrix._set(self._matrix._offsets[i] + self._j, value)
+
+    def __iter__(self):
+        m = self._matrix
+        return (m._get(o + self._j) for o in m._offsets)
+
+    def __eq__(self, other):
+        return self.tolist() == list(other)
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def count(self, value):
+        return self.tolist().count(value)
+
+    def tolist(self):
+        return list(self)
+
+
+# List-like view over the rows of a Matrix, kept so code written against the nested `rows` lists keeps working
+class _RowsView:
+    __slots__ = ("_matrix",)
+
+    def __init__(self, matrix):
+        self._matrix = matrix
+
+    def __len__(self):
+        return self._matrix.num_rows
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            return [_RowView(self._matrix, o) for o in self._matrix._offsets[i]]
+        return _RowView(self._matrix, self._matrix._offsets[i])
+
+    def __setitem__(self, i, values):
+        m = self._matrix
+        if type(values) == _RowView and values._matrix is m:
+            m._offsets[i] = values._offset  # Same aliasing as assigning a row list
+            m._lu = None
+        else:
+            m._replace_row(i, values)
+
+    def __iter__(self):
+        m = self._matrix
+        return (_RowView(m, o) for o in m._offsets)
+
+    def __repr__(self):
+        return repr([r.tolist() for r in self])
+
+    def sort(self, key=None, reverse=False):
+        m = self._matrix
+        if key is None:
+            key = _RowView.tolist
+        m._lu = None
+        m._offsets.sort(key=lambda o: key(_RowView(m, o)), reverse=reverse)
+
+
+# PA = LU with partial pivoting, for any m x n matrix.
+# Exact entries (ints, Fractions) are factored over fractions.Fraction and floats in floating point.
+# L (unit lower) and U share one row table: multipliers sit below the pivots of U.
+class LUDecomposition:
+    __slots__ = ("num_rows", "num_cols", "perm", "lu", "pivot_cols", "exact", "int_entries", "_sign")
+
+    def __init__(self, M: Matrix):
+        self.num_rows, self.num_cols = M.num_rows, M.num_cols
+        rows = [r.tolist() for r in M.rows]
+
+        self.int_entries = all(type(e) == int for r in rows for e in r)
+        self.exact = not any(type(e) == float for r in rows for e in r)
+        if self.exact:
+            rows = [[Fraction(e) if type(e) == int else e for e in r] for r in rows]
+            tol = 0
+        else:
+            # Float pivots this small relative to the entries are rounding residue, not rank
+            max_abs = max((abs(e) for r in rows for e in r), default=0)
+            tol = LU_FLOAT_EPS * max(self.num_rows, self.num_cols) * max_abs
+
+        self.perm = list(range(self.num_rows))
+        self.pivot_cols = []
+        self._sign = 1
+
+        r = 0
+        for j in range(self.num_cols):
+            if r == self.num_rows:
+                break
+
+            p = max(range(r, self.num_rows), key=lambda i: abs(rows[i][j]))
+            if abs(rows[p][j]) <= tol:
+                continue  # No pivot in this column
+            if p != r:
+                rows[r], rows[p] = rows[p], rows[r]
+                self.perm[r], self.perm[p] = self.perm[p], self.perm[r]
+                self._sign = -self._sign
+
+            pivot_row = rows[r]
+            pivot = pivot_row[j]
+            for i in range(r + 1, self.num_rows):
+                row = rows[i]
+                f = row[j] / pivot
+                row[j] = f
+                if f:
+                    for k in range(j + 1, self.num_cols):
+                        row[k] -= f * pivot_row[k]
+
+            self.pivot_cols.append(j)
+            r += 1
+
+        self.lu = rows
+
+    def rank(self):
+        return len(self.pivot_cols)
+
+    def is_singular(self):
+        return self.num_rows != self.num_cols or self.rank() < self.num_rows
+
+    def determinant(self):
+        if self.num_rows != self.num_cols:
+            raise ArithmeticError("Determinant undefined for non-square matrix: {}x{}".format(
+                self.num_rows, self.num_cols))
+        if self.is_singular():
+            return 0
+
+        det = self._sign
+        for i in range(self.num_rows):
+            det *= self.lu[i][i]
+
+        return int(det) if self.int_entries else det
+
+    def solve(self, b):
+        # Solves Ax = b. b is a Matrix with one column per right-hand side, or a flat sequence for just one.
+        # Returns the solution in the same form.
+        if self.is_singular():
+            raise ArithmeticError("Can't solve a singular or non-square system")
+
+        n = self.num_rows
+        single = not isinstance(b, Matrix)
+        b_rows = [[e] for e in b] if single else [r.tolist() for r in b.rows]
+        if len(b_rows) != n:
+            raise ArithmeticError("Right-hand side has {} rows, expected {}".format(len(b_rows), n))
+
+        lu = self.lu
+        if self.exact:
+            if any(type(e) == float for r in b_rows for e in r):
+                # Float right-hand sides give a float solution, from the exact factors rounded once
+                lu = [[float(e) for e in r] for r in lu]
+            else:
+                b_rows = [[Fraction(e) if type(e) == int else e for e in r] for r in b_rows]
+
+        # Forward substitution with L, on the permuted right-hand sides
+        y = []
+        for i in range(n):
+            row = b_rows[self.perm[i]]
+            lu_row = lu[i]
+            for k in range(i):
+                if lu_row[k]:
+                    row = [a - lu_row[k] * c for a, c in zip(row, y[k])]
+            y.append(row)
+
+        # Back substitution with U
+        x = [None] * n
+        for i in range(n - 1, -1, -1):
+            row = y[i]
+            lu_row = lu[i]
+            for k in range(i + 1, n):
+                if lu_row[k]:
+                    row = [a - lu_row[k] * c for a, c in zip(row, x[k])]
+            x[i] = [a / lu_row[i] for a in row]
+
+        return [r[0] for r in x] if single else Matrix(x)
+
+    def inverse(self):
+        n = self.num_rows
+        return self.solve(Matrix([[int(i == j) for j in range(n)] for i in range(n)]))
+
+
 class Vector(Matrix):
-    def __init__(self, values):
-        super().__init__([[v] for v in values])
+    __slots__ = ()
+
+    def __init__(self, values, backend=None):
+        super().__init__([[v] for v in values], backend)
 
     def magnitude(self):
-        return sqrt(sum(x[0] ** 2 for x in self.rows))
+        flat = self.flat()
+        if type(flat) == _ndarray and abs_bound(flat) ** 2 * len(flat) <= INT64_MAX:
+            return sqrt(np.dot(flat, flat).item())
+
+        return sqrt(sum(x ** 2 for x in self._values()))
 
     # Applicable for 3 dimensions only.
     def cross_product(self, other):
@@ -113,22 +925,203 @@ class Vector(Matrix):
         # todo: finish cross product
 
     def dot_product(self, other):
-        if self.num_rows == other.num_rows == 1:  # row vectors
-            return sum([self.rows[0][i] * other.rows[0][i] for i in range(self.num_cols)])
+        # Row and column vectors share the same flat layout, so any combination of the two works directly
+        if 1 in (self.num_rows, self.num_cols) and 1 in (other.num_rows, other.num_cols) and \
+                len(self.flat()) == len(other.flat()):
+            pair = numpy_pair(self.flat(), other.flat())
+            if pair is not None and abs_bound(pair[0]) * abs_bound(pair[1]) * len(pair[0]) <= INT64_MAX:
+                return np.dot(*pair).item()
 
-        elif self.num_cols == other.num_cols == 1:  # column vectors
-            return sum([self.rows[i][0] * other.rows[i][0] for i in range(self.num_rows)])
-
-        elif self.num_cols == other.num_rows == 1 or self.num_rows == other.num_cols == 1:  # col/row vector combination
-            return self.transpose().dot_product(other)
+            return sum(map(mul, self._values(), other._values()))
 
         else:
             raise ArithmeticError("Dot Product unavailable for matrix dimensions: {}x{} and {}x{}".format(
                 self.num_rows, self.num_cols, other.num_rows, other.num_cols))
 
 
+# Compressed sparse row (CSR) storage: the nonzeros of row i are values[indptr[i]:indptr[i + 1]],
+# in the (ascending) columns at the same positions of col_indices. Arithmetic returns new instances.
+class SparseMatrix:
+    __slots__ = ("num_rows", "num_cols", "values", "col_indices", "indptr")
+
+    def __init__(self, rows):
+        # rows: dense rows, as for Matrix
+        rows = list(rows)
+        num_cols = len(rows[0])
+        if any(len(r) != num_cols for r in rows):
+            raise ValueError("All rows of a SparseMatrix must have the same length")
+
+        self._build(len(rows), num_cols, ({j: e for j, e in enumerate(r) if e} for r in rows))
+
+    def _build(self, num_rows, num_cols, row_dicts):
+        values = []
+        col_indices = array("q")
+        indptr = array("q", [0])
+        for row in row_dicts:
+            for j in sorted(row):
+                if row[j]:
+                    values.append(row[j])
+                    col_indices.append(j)
+            indptr.append(len(col_indices))
+
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.values = make_buffer(values)
+        self.col_indices = col_indices
+        self.indptr = indptr
+
+    @classmethod
+    def from_row_dicts(cls, num_rows, num_cols, row_dicts):
+        # row_dicts: one {column: value} dict per row
+        m = cls.__new__(cls)
+        m._build(num_rows, num_cols, row_dicts)
+        return m
+
+    @classmethod
+    def from_coo(cls, num_rows, num_cols, entries):
+        # entries: (row, column, value) triples in any order. Duplicates are summed.
+        row_dicts = [{} for _ in range(num_rows)]
+        for i, j, v in entries:
+            if not (0 <= i < num_rows and 0 <= j < num_cols):
+                raise IndexError("Entry ({}, {}) outside a {}x{} matrix".format(i, j, num_rows, num_cols))
+            row_dicts[i][j] = row_dicts[i].get(j, 0) + v
+
+        return cls.from_row_dicts(num_rows, num_cols, row_dicts)
+
+    @classmethod
+    def from_matrix(cls, M: Matrix):
+        return cls.from_row_dicts(M.num_rows, M.num_cols, ({j: e for j, e in enumerate(r) if e} for r in M.rows))
+
+    def to_matrix(self):
+        flat = [0] * (self.num_rows * self.num_cols)
+        for i in range(self.num_rows):
+            base = i * self.num_cols
+            for j, v in self.row_items(i):
+                flat[base + j] = v
+
+        return Matrix._from_flat(make_buffer(flat), self.num_rows, self.num_cols)
+
+    def to_coo(self):
+        return [(i, j, v) for i in range(self.num_rows) for j, v in self.row_items(i)]
+
+    @property
+    def nnz(self):
+        return len(self.col_indices)
+
+    def row_items(self, i):
+        # (column, value) pairs of the nonzeros in row i
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return zip(self.col_indices[lo:hi], self.values[lo:hi])
+
+    def row_dict(self, i):
+        return dict(self.row_items(i))
+
+    def row(self, i):
+        dense = [0] * self.num_cols
+        for j, v in self.row_items(i):
+            dense[j] = v
+        return dense
+
+    def __repr__(self):
+        return repr(self.to_matrix())
+
+    def __add__(self, other):
+        if self.num_rows != other.num_rows or self.num_cols != other.num_cols:
+            raise ArithmeticError(
+                "Can't add matrices of differing dimensions: {}x{} and {}x{}".format(self.num_rows, self.num_cols,
+                                                                                     other.num_rows, other.num_cols))
+
+        if type(other) != SparseMatrix:
+            flat = list(other._values())
+            for i in range(self.num_rows):
+                base = i * self.num_cols
+                for j, v in self.row_items(i):
+                    flat[base + j] += v
+            return Matrix._from_flat(make_buffer(flat), self.num_rows, self.num_cols)
+
+        row_dicts = []
+        for i in range(self.num_rows):
+            row = self.row_dict(i)
+            for j, v in other.row_items(i):
+                row[j] = row.get(j, 0) + v
+            row_dicts.append(row)
+
+        return SparseMatrix.from_row_dicts(self.num_rows, self.num_cols, row_dicts)
+
+    def __mul__(self, other):
+        if type(other) in [int, float]:
+            return self.scalar_mul(other)
+        if type(other) == SparseMatrix or isinstance(other, Matrix):
+            return self.matrix_mul(other)
+
+        raise TypeError("Multiplication unsupported for types: {} and {}".format(type(self), type(other)))
+
+    def scalar_mul(self, c):
+        return SparseMatrix.from_row_dicts(self.num_rows, self.num_cols,
+                                           ({j: v * c for j, v in self.row_items(i)} for i in range(self.num_rows)))
+
+    def matrix_mul(self, other):
+        # Sparse x sparse stays sparse (row by row, accumulating into a dict); sparse x dense gives a dense Matrix
+        if self.num_cols != other.num_rows:
+            raise ArithmeticError(
+                "Can't multiple Matrices: {}x{} and {}x{}".format(self.num_rows, self.num_cols, other.num_rows,
+                                                                  other.num_cols))
+
+        if type(other) == SparseMatrix:
+            row_dicts = []
+            for i in range(self.num_rows):
+                acc = {}
+                for k, v in self.row_items(i):
+                    for j, w in other.row_items(k):
+                        acc[j] = acc.get(j, 0) + v * w
+                row_dicts.append(acc)
+            return SparseMatrix.from_row_dicts(self.num_rows, other.num_cols, row_dicts)
+
+        p = other.num_cols
+        b = list(other._values())
+        flat = []
+        for i in range(self.num_rows):
+            acc = [0] * p
+            for k, v in self.row_items(i):
+                acc = [a + v * e for a, e in zip(acc, b[k * p:(k + 1) * p])]
+            flat += acc
+
+        return Matrix._from_flat(make_buffer(flat), self.num_rows, p)
+
+    def transpose(self):
+        # Counting sort of the entries by column
+        counts = [0] * (self.num_cols + 1)
+        for j in self.col_indices:
+            counts[j + 1] += 1
+        for j in range(self.num_cols):
+            counts[j + 1] += counts[j]
+
+        indptr = array("q", counts)
+        next_slot = counts[:-1]
+        values = [0] * self.nnz
+        col_indices = array("q", bytes(8 * self.nnz))
+        for i in range(self.num_rows):
+            for j, v in self.row_items(i):
+                k = next_slot[j]
+                values[k] = v
+                col_indices[k] = i
+                next_slot[j] += 1
+
+        t = SparseMatrix.__new__(SparseMatrix)
+        t.num_rows, t.num_cols = self.num_cols, self.num_rows
+        t.values, t.col_indices, t.indptr = make_buffer(values), col_indices, indptr
+        return t
+
+    def is_zero(self):
+        return self.nnz == 0
+
+    def is_identity(self):
+        return self.num_rows == self.num_cols == self.nnz and all(
+            list(self.row_items(i)) == [(i, 1)] for i in range(self.num_rows))
+
+
 def get_unit_vectors(dimensions):
-    vectors = [[0] * dimensions] * dimensions
+    vectors = [[0] * dimensions for _ in range(dimensions)]
     for i, v in enumerate(vectors):
         v[i] = 1
 
@@ -136,7 +1129,7 @@ def get_unit_vectors(dimensions):
 
 
 def get_identity_matrix(n):
-    rows = [[0] * n] * n
+    rows = [[0] * n for _ in range(n)]
     for i in range(n):
         rows[i][i] = 1
 
@@ -1,126 +1,235 @@
 import functools
-from copy import deepcopy
 from random import randrange
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import matrix_base as mb
-from number_functions import lowest_common_multiple, greatest_common_divisor
+from number_functions import extended_gcd, greatest_common_divisor, lowest_common_multiple
 
 
-def row_echelon(A: mb.Matrix):
+def row_echelon(A: mb.Matrix, in_place=False):
     # A: Augmented matrix representing linear system
+    # in_place: overwrite A with the result instead of returning a new Matrix
     # todo: fix bug giving incorrect resulting matrix
 
-    A = deepcopy(A)
+    _check_in_place(A, in_place)
+    A_dense = _as_dense(A)
+    if A_dense.backend == "numpy":
+        U = mb.Matrix.from_numpy(_row_echelon_numpy(A_dense))
+        if in_place:
+            A._replace_with(U)
+            return A
+        return U
+
+    rows = [r.tolist() for r in A_dense.rows]
 
     for k in range(min(A.num_rows, A.num_cols)):
         # Find k-th pivot
-        i_max = max([i for i in range(k, A.num_rows)], key=lambda e: abs(A.rows[e][k]))
-        if A.rows[i_max][k] == 0:
+        i_max = max([i for i in range(k, A.num_rows)], key=lambda e: abs(rows[e][k]))
+        if rows[i_max][k] == 0:
             print("Matrix is singular!")
 
-        A.rows[i_max], A.rows[k] = A.rows[k], A.rows[i_max]
+        rows[i_max], rows[k] = rows[k], rows[i_max]
+        pivot_row = rows[k]
 
         # Do for all rows below pivot
         for i in range(k + 1, A.num_rows):
-            f = A.rows[i][k] / A.rows[k][k]
+            row = rows[i]
+            f = row[k] / pivot_row[k]
             # Do for all remaining elements in current row
-            for j in range(k + 1, A.num_cols):
-                A.rows[i][j] -= A.rows[k][j] * f
+            row[k + 1:] = [e - p * f for e, p in zip(row[k + 1:], pivot_row[k + 1:])]
 
             # Fill lower triangular matrix with 0's
-            A.rows[i][k] = 0
-
-    return A
-
-
-def row_echelon_int(M: mb.Matrix):
-    # Transforms matrix to REF keeping the entries as integers
-
-    M = deepcopy(M)
-    # print("Start:", M, sep="\n")
-
-    min_i = 0
-    min_j = 0
-    while min_i < M.num_rows and min_j < M.num_cols:
-        # print("Iteration", min_i, ":")
-        # Send 0 starting rows to bottom
-        sort_matrix(M)
-        num_zeros = count_zero_rows(M)
-
-        # print("After moving 0 rows:", M, sep="\n")
+            row[k] = 0
 
-        # Increase rows to lcm
-        nz_col = [M.rows[i][min_j] for i in range(min_i, M.num_rows - num_zeros) if M.rows[i][min_j] != 0]
-        lcm = lowest_common_multiple(*nz_col)
-        for i in range(min_i, min_i + len(nz_col)):
-            factor = lcm // M.rows[i][min_j]
-            M.scale_row(i, factor)
+    return _store_rows(A, rows) if in_place else mb.Matrix(rows, A_dense.backend)
 
-        # print("After scaling up col by {}:".format(lcm), M, sep="\n")
 
-        # Subtract 1st row from all below rows
-        for i in range(min_i + 1, min_i + len(nz_col)):
-            M.add_row(i, min_i, -1)
+def _check_in_place(M, in_place):
+    if in_place and type(M) == mb.SparseMatrix:
+        raise TypeError("In-place elimination needs a dense Matrix")
 
-        # print("After subtracting under pivot:", M, sep="\n")
 
-        # Reduce first row
-        nz_row = [e for e in M.rows[min_i] if e != 0]
-        gcd = greatest_common_divisor(*nz_row)
-        M.scale_row(min_i, 1 / gcd)
-        if M.rows[min_i][min_j] < 0:  # Make positive
-            M.scale_row(min_i, -1)
+def _row_echelon_numpy(A: mb.Matrix):
+    # Same elimination as row_echelon, one vectorized row block per pivot. Returns the 2-D ndarray.
+    U = A.to_numpy().astype(np.float64)
 
-        # print("After cleaning first row:", M, sep="\n")
-
-        min_i += 1
-        min_j += 1
-
-    return M
-
-
-def reduced_row_echelon_int(M: mb.Matrix):
-    # Given result from row_echelon_int
-    # Transforms REF matrix into Reduced REF
+    for k in range(min(A.num_rows, A.num_cols)):
+        i_max = k + int(np.argmax(np.abs(U[k:, k])))
+        if U[i_max, k] == 0:
+            print("Matrix is singular!")
+            if k + 1 < A.num_rows:
+                raise ZeroDivisionError("float division by zero")
 
-    M = deepcopy(M)
-    # print("Start:", M, sep="\n")
+        U[[k, i_max]] = U[[i_max, k]]
 
-    num_zeros = count_zero_rows(M)
+        f = U[k + 1:, k] / U[k, k]
+        U[k + 1:, k + 1:] -= np.outer(f, U[k, k + 1:])
+        U[k + 1:, k] = 0
 
-    for i in range(M.num_rows - num_zeros - 1, -1, -1):
-        pivot_col_j = next(j for j in range(M.num_cols) if M.rows[i][j] != 0)
+    return U
 
-        # Scaling pivots to lcm
-        nz_pivot_col = [M.rows[_i][pivot_col_j] for _i in range(M.num_rows) if M.rows[_i][pivot_col_j] != 0]
-        lcm = lowest_common_multiple(*nz_pivot_col)
-        for _i in range(i + 1):
-            factor = lcm // M.rows[_i][pivot_col_j]
-            M.scale_row(_i, factor)
 
-        # print("After pivot col {} scaled to lcm:".format(pivot_col_j), M, sep="\n")
+def row_echelon_int(M: mb.Matrix, in_place=False):
+    # Transforms matrix to REF keeping the entries as integers.
+    # Each nonzero row is primitive (gcd of its entries is 1) with a positive pivot.
+    # A SparseMatrix is eliminated in sparse form and gives a SparseMatrix.
+    return _echelon_int(M, in_place, reduced=False)
 
-        # Subtracting pivot row from above rows
-        for _i in range(i):
-            M.add_row(_i, i, -1)
 
-        # print("After pivot row subtracted from above:", M, sep="\n")
+def reduced_row_echelon_int(M: mb.Matrix, in_place=False):
+    # Transforms matrix into Reduced REF keeping the entries as integers.
+    # Pivot columns are zero apart from the pivot, and each row is primitive with a positive pivot,
+    # which makes the result unique for a given row space.
+    return _echelon_int(M, in_place, reduced=True)
 
-        # Reduce pivot row
-        nz_row = [e for e in M.rows[i] if e != 0]
-        gcd = greatest_common_divisor(*nz_row)
-        M.scale_row(i, 1 / gcd)
-        if M.rows[i][pivot_col_j] < 0:  # Make positive
-            M.scale_row(i, -1)
 
-            # print("After pivot row cleaned up:", M, sep="\n")
+def _echelon_int(M, in_place, reduced):
+    if type(M) == mb.SparseMatrix:
+        rows = _integer_row_dicts(M)
+        _eliminate_int_sparse(rows, reduced)
+        if in_place:
+            M._build(M.num_rows, M.num_cols, rows)
+            return M
+        return mb.SparseMatrix.from_row_dicts(M.num_rows, M.num_cols, rows)
 
-    return M
+    rows = _integer_rows(M)
+    _eliminate_int(rows, M.num_cols, reduced)
+    return _store_rows(M, rows) if in_place else mb.Matrix(rows)
 
 
-def reduced_row_echelon(A: mb.Matrix):
+def _integer_rows(M: mb.Matrix):
+    # Rows of M as exact ints. Rows holding Fractions or non-integral floats are scaled by the lcm of
+    # their denominators, which leaves the row space (and so REF/RREF) unchanged.
+    rows = []
+    for row in M.rows:
+        ratios = [_as_ratio(e) for e in row]
+        scale = lowest_common_multiple(*{d for _, d in ratios})
+        rows.append([n * (scale // d) for n, d in ratios])
+
+    return rows
+
+
+def _integer_row_dicts(S: mb.SparseMatrix):
+    # _integer_rows for a SparseMatrix, as {column: value} dicts
+    rows = []
+    for i in range(S.num_rows):
+        ratios = {j: _as_ratio(e) for j, e in S.row_items(i)}
+        scale = lowest_common_multiple(*{d for _, d in ratios.values()}) if ratios else 1
+        rows.append({j: n * (scale // d) for j, (n, d) in ratios.items()})
+
+    return rows
+
+
+def _as_dense(M):
+    return M.to_matrix() if type(M) == mb.SparseMatrix else M
+
+
+def _as_ratio(e):
+    if type(e) == int:
+        return e, 1
+    if type(e) == float:
+        return e.as_integer_ratio()
+    return e.numerator, e.denominator
+
+
+def _make_primitive(row):
+    # Divides out the content of an integer row and makes its leading entry positive
+    content = abs(greatest_common_divisor(*row))
+    if content > 1:
+        row = [e // content for e in row]
+
+    lead = next((e for e in row if e), 0)
+    return [-e for e in row] if lead < 0 else row
+
+
+def _eliminate_int(rows, num_cols, reduced=False):
+    # Fraction-free Gauss(-Jordan) elimination on integer rows, in place. Returns the pivot columns.
+    # Clearing entry b of row i against pivot a uses row_i * (a / g) - pivot_row * (b / g), g = gcd(a, b),
+    # then divides out the row's content, so entries stay integers and don't grow from step to step.
+    num_rows = len(rows)
+    pivot_cols = []
+
+    r = 0
+    for j in range(num_cols):
+        if r == num_rows:
+            break
+
+        # Smallest nonzero pivot keeps the multipliers small
+        candidates = [i for i in range(r, num_rows) if rows[i][j]]
+        if not candidates:
+            continue
+        p = min(candidates, key=lambda i: abs(rows[i][j]))
+        rows[r], rows[p] = rows[p], rows[r]
+        rows[r] = pivot_row = _make_primitive(rows[r])
+        a = pivot_row[j]
+
+        for i in (range(num_rows) if reduced else range(r + 1, num_rows)):
+            b = rows[i][j]
+            if i == r or not b:
+                continue
+            g = greatest_common_divisor(a, b)
+            rows[i] = _make_primitive([e * (a // g) - f * (b // g) for e, f in zip(rows[i], pivot_row)])
+
+        pivot_cols.append(j)
+        r += 1
+
+    return pivot_cols
+
+
+def _make_primitive_sparse(row):
+    content = abs(greatest_common_divisor(*row.values())) if row else 1
+    lead = row[min(row)] if row else 0
+    if lead < 0:
+        content = -content
+    return {j: e // content for j, e in row.items()} if content != 1 else row
+
+
+def _eliminate_int_sparse(rows, reduced=False):
+    # _eliminate_int on rows stored as {column: value} dicts, so zero entries are never visited.
+    # Combining two rows only touches columns one of them already uses, so no new columns appear.
+    num_rows = len(rows)
+    pivot_cols = []
+
+    r = 0
+    for j in sorted(set().union(*rows)):
+        if r == num_rows:
+            break
+
+        candidates = [i for i in range(r, num_rows) if rows[i].get(j)]
+        if not candidates:
+            continue
+        p = min(candidates, key=lambda i: abs(rows[i][j]))
+        rows[r], rows[p] = rows[p], rows[r]
+        rows[r] = pivot_row = _make_primitive_sparse(rows[r])
+        a = pivot_row[j]
+
+        for i in (range(num_rows) if reduced else range(r + 1, num_rows)):
+            b = rows[i].get(j)
+            if i == r or not b:
+                continue
+            g = greatest_common_divisor(a, b)
+            row = {k: e * (a // g) for k, e in rows[i].items()}
+            for k, f in pivot_row.items():
+                e = row.get(k, 0) - f * (b // g)
+                if e:
+                    row[k] = e
+                else:
+                    row.pop(k, None)
+            rows[i] = _make_primitive_sparse(row)
+
+        pivot_cols.append(j)
+        r += 1
+
+    return pivot_cols
+
+
+def reduced_row_echelon(A: mb.Matrix, in_place=False):
     # A: Augmented matrix representing linear system
-    A = row_echelon(A)
+    A = row_echelon(A, in_place)
 
     for i in range(A.num_cols - 2, -1, -1):
         A.rows[i][-1] /= A.rows[i][i]
@@ -134,83 +243,337 @@ def reduced_row_echelon(A: mb.Matrix):
     return A
 
 
-def hermite_normal_form(M: mb.Matrix):
+def hermite_normal_form(M: mb.Matrix, in_place=False, trace=None):
     # https://en.wikipedia.org/wiki/Hermite_normal_form
-
-    if M.is_zero():
+    # Row-style HNF by unimodular integer row operations: upper triangular, positive pivots,
+    # entries above each pivot reduced into [0, pivot), zero rows at the bottom.
+    # Entries are reduced modulo the absolute value of a nonzero maximal minor, which bounds every entry by it.
+    # in_place: write the result back into M instead of returning a new Matrix.
+    # trace: optional callable, called after each step as trace(message, rows, *numbers) with the working rows.
+    # The {} fields of the message take the numbers, as in logging calls; they are left unformatted since they
+    # can be too big to print.
+    rows = _hermite_rows(_hermite_input(M), M.num_cols, trace)
+
+    if in_place:
+        return _store_rows(M, rows)
+    return mb.SparseMatrix(rows) if type(M) == mb.SparseMatrix else mb.Matrix(rows)
+
+
+def smith_normal_form(M: mb.Matrix, in_place=False, trace=None):
+    # https://en.wikipedia.org/wiki/Smith_normal_form
+    # Diagonal matrix of the invariant factors d1 | d2 | ... (all positive), padded with zeros.
+    # Starts from the HNF so the entries are already small, then clears rows and columns with extended gcd steps.
+    rows = [r.tolist() for r in hermite_normal_form(M, trace=trace).rows]
+    num_rows, num_cols = M.num_rows, M.num_cols
+
+    for t in range(min(num_rows, num_cols)):
+        nonzero = [(i, j) for i in range(t, num_rows) for j in range(t, num_cols) if rows[i][j]]
+        if not nonzero:
+            break
+
+        # Smallest entry as the pivot
+        i, j = min(nonzero, key=lambda ij: abs(rows[ij[0]][ij[1]]))
+        rows[t], rows[i] = rows[i], rows[t]
+        _swap_columns(rows, t, j)
+
+        while True:
+            _fold_below(rows, t, t, t + 1)
+
+            for j in range(t + 1, num_cols):
+                b = rows[t][j]
+                if not b:
+                    continue
+                a = rows[t][t]
+                if b % a == 0:
+                    q = b // a
+                    for row in rows:
+                        row[j] -= q * row[t]
+                else:
+                    g, x, y = extended_gcd(a, b)
+                    for row in rows:
+                        e, f = row[t], row[j]
+                        row[t], row[j] = x * e + y * f, (b // g) * e - (a // g) * f
+
+            if any(rows[i][t] for i in range(t + 1, num_rows)):
+                continue  # Column ops refilled the pivot column
+
+            # The pivot must divide every remaining entry. If one doesn't, fold its row in and go again.
+            a = rows[t][t]
+            bad = next((i for i in range(t + 1, num_rows) if any(e % a for e in rows[i][t + 1:])), None)
+            if bad is None:
+                break
+            rows[t] = [e + f for e, f in zip(rows[t], rows[bad])]
+
+        if rows[t][t] < 0:
+            rows[t][t] = -rows[t][t]
+
+        if trace is not None:
+            trace("Invariant factor {}: {}", rows, t + 1, rows[t][t])
+
+    if in_place:
+        return _store_rows(M, rows)
+    return mb.SparseMatrix(rows) if type(M) == mb.SparseMatrix else mb.Matrix(rows)
+
+
+def _hermite_input(M: mb.Matrix):
+    M = _as_dense(M)
+    rows = _integer_rows(M)
+    if any(_as_ratio(e)[1] != 1 for row in M.rows for e in row):
+        raise ArithmeticError("Hermite normal form needs an integer matrix")
+    return rows
+
+
+def _store_rows(M: mb.Matrix, rows):
+    if type(M) == mb.SparseMatrix:
+        M._build(M.num_rows, M.num_cols, ({j: e for j, e in enumerate(r) if e} for r in rows))
         return M
 
-    print("Start:", M, sep="\n")
-
-    M = deepcopy(M)
-
-    # Send 0 starting rows to bottom
-    i = 0
-    num_zeros = 0
-    while i < M.num_rows - num_zeros:
-        if M.rows[i][0] == 0:
-            print("Swapping rows:", i, M.rows[i], ",", M.num_rows - num_zeros - 1, M.rows[M.num_rows - num_zeros - 1])
-            M.swap_rows(i, M.num_rows - num_zeros - 1)
-            num_zeros += 1
-        i += 1
-
-    # Increase rows to lcm
-    nz_col = [M.rows[i][0] for i in range(M.num_rows - num_zeros)]
-    lcm = lowest_common_multiple(*nz_col)
-    for i in range(M.num_rows - num_zeros):
-        factor = lcm // nz_col[i]
-        print("Multiplying row by", factor, ":", i, M.rows[i], "->", end=" ")
-        M.scale_row(i, factor)
-        print(M.rows[i])
-
-    # Subtract 1st row from all below rows
-    print("Subtracting row:", 0, M.rows[0])
-    for i in range(1, M.num_rows - num_zeros):
-        print("\t", M.rows[i], "->", end=" ")
-        M.add_row(i, 0, -1)
-        print(M.rows[i])
-
-    # Clean up 1st row
-    gcd = greatest_common_divisor(*M.rows[0])
-    print("Scaling row by 1 /", gcd, ":", M.rows[0], "->", end=" ")
-    M.scale_row(0, 1 / gcd)
-    if M.rows[0][0] < 0:
-        M.scale_row(0, -1)
-    print(M.rows[0])
-
-    # Calculation and insertion of the sub-matrix in H-normal form
-    print("---")
-    sub = hermite_normal_form(M.sub_matrix(0, 0))
-    for i in range(sub.num_rows):
-        for j in range(sub.num_cols):
-            M.rows[1 + i][1 + j] = sub.rows[i][j]
-
+    for i, row in enumerate(rows):
+        M.rows[i] = row
     return M
 
 
+def _swap_columns(rows, j1, j2):
+    if j1 != j2:
+        for row in rows:
+            row[j1], row[j2] = row[j2], row[j1]
+
+
+def _fold_below(rows, r, j, start, modulus=None):
+    # Combines rows start.. into row r with extended gcd steps until row r holds the gcd of column j
+    for i in range(start, len(rows)):
+        b = rows[i][j]
+        if not b:
+            continue
+        a = rows[r][j]
+        pivot_row, row = rows[r], rows[i]
+        if a and b % a == 0:
+            q = b // a
+            rows[i] = [f - q * e for e, f in zip(pivot_row, row)]
+        else:
+            g, x, y = extended_gcd(a, b)
+            rows[r] = [x * e + y * f for e, f in zip(pivot_row, row)]
+            rows[i] = [(b // g) * e - (a // g) * f for e, f in zip(pivot_row, row)]
+        if modulus is not None:
+            rows[r] = [e % modulus for e in rows[r]]
+            rows[i] = [e % modulus for e in rows[i]]
+
+
+def _reduce_above(rows, r, j, modulus, trace=None):
+    # Brings the entries above the pivot rows[r][j] into [0, pivot). Columns past j are unfinished,
+    # so they are reduced mod modulus as they change.
+    pivot_row = rows[r]
+    a = pivot_row[j]
+    for i in range(r):
+        row = rows[i]
+        q = row[j] // a
+        if q:
+            rows[i] = row[:j] + [row[j] - q * a] + [(e - q * f) % modulus for e, f in zip(row[j + 1:], pivot_row[j + 1:])]
+            if trace is not None:
+                trace("Reduced row {} by {} x row {}", rows, i, q, r)
+
+
+def _maximal_minor(rows):
+    # Fraction-free (Bareiss) elimination picking the first independent columns.
+    # Returns the pivot columns, the rows that supplied them and the absolute value of that nonzero minor.
+    rows = [r[:] for r in rows]
+    order = list(range(len(rows)))
+    pivot_cols = []
+    prev = 1
+    for j in range(len(rows[0]) if rows else 0):
+        r = len(pivot_cols)
+        p = next((i for i in range(r, len(rows)) if rows[i][j]), None)
+        if p is None:
+            continue
+        rows[r], rows[p] = rows[p], rows[r]
+        order[r], order[p] = order[p], order[r]
+
+        pivot_row = rows[r]
+        pivot = pivot_row[j]
+        for i in range(r + 1, len(rows)):
+            row = rows[i]
+            f = row[j]
+            rows[i] = [(pivot * e - f * g) // prev for e, g in zip(row, pivot_row)]
+        prev = pivot
+        pivot_cols.append(j)
+
+    return pivot_cols, order[:len(pivot_cols)], abs(prev)
+
+
+def _hermite_rows(rows, num_cols, trace=None):
+    # HNF of integer rows. The pivot columns P of the HNF are the first independent columns, so the HNF of the
+    # rows restricted to P comes from the modular algorithm, and every lattice row v is determined by its
+    # pivot entries: v = v_P * A_BP^-1 * A_B, with A_BP the nonzero minor on rows B and columns P.
+    pivot_cols, minor_rows, modulus = _maximal_minor(rows)
+    if not pivot_cols:
+        return [[0] * num_cols for _ in rows]
+
+    hnf = [[row[j] for j in pivot_cols] for row in rows]
+    _hermite_rows_mod(hnf, modulus, trace)
+    if len(pivot_cols) == num_cols:
+        return hnf
+
+    # modulus * A_BP^-1 is an integer matrix, so the other columns follow with one exact division each
+    others = [j for j in range(num_cols) if j not in set(pivot_cols)]
+    minor = mb.Matrix([[rows[i][j] for j in pivot_cols] for i in minor_rows], "python")
+    solved = minor.lu().solve(mb.Matrix([[rows[i][j] for j in others] for i in minor_rows], "python"))
+    scaled_cols = [[int(e * modulus) for e in col] for col in zip(*(r.tolist() for r in solved.rows))]
+
+    result = []
+    for h in hnf:
+        row = [0] * num_cols
+        if any(h):
+            for j, e in zip(pivot_cols, h):
+                row[j] = e
+            for j, col in zip(others, scaled_cols):
+                row[j] = sum(a * b for a, b in zip(h, col)) // modulus
+        result.append(row)
+
+    return result
+
+
+def _hermite_rows_mod(rows, modulus, trace=None):
+    # HNF, in place, of integer rows whose lattice has full rank n = len(rows[0]), working modulo D,
+    # the absolute value of a nonzero n x n minor. D * Z^n lies inside the lattice, and once the pivots of
+    # columns 0..j are found, so does R * e_k for k > j, with R = D / (product of those pivots). So every entry
+    # right of the finished columns is kept reduced mod R, in the rows above the pivots as well
+    # (Cohen, A Course in Computational Algebraic Number Theory, algorithm 2.4.8, on rows).
+    n = len(rows[0])
+    rows[:] = [[e % modulus for e in row] for row in rows]
+
+    for j in range(n):
+        _fold_below(rows, j, j, j + 1, modulus)
+
+        # Keep only the part of the pivot shared with the modulus; the rest comes from the R * e_j rows
+        g, u, _ = extended_gcd(rows[j][j], modulus)
+        pivot_row = [(u * e) % modulus for e in rows[j]]
+        if pivot_row[j] == 0:
+            pivot_row[j] = modulus
+
+        modulus //= g
+        pivot_row[j + 1:] = [e % modulus for e in pivot_row[j + 1:]]
+        rows[j] = pivot_row
+        for i in range(j + 1, len(rows)):
+            rows[i] = [e % modulus for e in rows[i]]
+
+        if trace is not None:
+            trace("Pivot {} in row {}, remaining modulus {}", rows, pivot_row[j], j, modulus)
+
+        _reduce_above(rows, j, j, modulus, trace)
+
+    # The lattice has rank n, so everything below the pivot rows has been reduced to zero
+    for i in range(n, len(rows)):
+        rows[i] = [0] * n
+
+
 def round_matrix(M: mb.Matrix, decimal_threshold=6):
     for i in range(M.num_rows):
         for k in range(M.num_cols):
-            if abs(round(M.rows[i][k]) - M.rows[i][k]) < 0.1 ** -decimal_threshold:
+            if abs(round(M.rows[i][k]) - M.rows[i][k]) < 0.1 ** decimal_threshold:
                 M.rows[i][k] = round(M.rows[i][k])
 
 
-def determinant(M: mb.Matrix):
+def determinant(M: mb.Matrix, algorithm=None):
+    # algorithm: "bareiss" (fraction-free elimination, exact), "lu" (partial pivoting, for floats)
+    # or "expansion" (cofactor expansion along the first column, O(n!)).
+    # By default floats use LU and everything else (ints, Fractions) uses Bareiss.
+    M = _as_dense(M)
+    if algorithm == "expansion":
+        return _determinant_expansion(M)
+
+    if M.num_rows != M.num_cols:
+        raise ArithmeticError("Determinant undefined for non-square matrix: {}x{}".format(M.num_rows, M.num_cols))
+
+    rows = [r.tolist() for r in M.rows]
+    if algorithm is None:
+        algorithm = "lu" if any(type(e) == float for r in rows for e in r) else "bareiss"
+
+    if algorithm == "lu":
+        if M.backend == "numpy":
+            return np.linalg.det(M.to_numpy().astype(np.float64)).item()
+        return _determinant_lu(rows)
+    if algorithm == "bareiss":
+        return _determinant_bareiss(rows)
+
+    raise ValueError("Unknown determinant algorithm: {}".format(algorithm))
+
+
+def _determinant_expansion(M: mb.Matrix):
     # Determinant of given matrix by expansion along first column
     if M.num_rows == 1:
         return M.rows[0][0]
 
     return sum(
-        ((-1) ** i) * M.rows[i][0] * determinant(M.sub_matrix(i, 0))
+        ((-1) ** i) * M.rows[i][0] * _determinant_expansion(M.sub_matrix(i, 0))
         for i in range(M.num_rows)
     )
 
 
+def _determinant_bareiss(rows):
+    # https://en.wikipedia.org/wiki/Bareiss_algorithm
+    # Every division is exact, so ints stay ints and never grow past the size of a minor.
+    n = len(rows)
+    if n == 0:
+        return 1
+
+    exact_ints = all(type(e) == int for r in rows for e in r)
+    sign = 1
+    prev = 1
+    for k in range(n - 1):
+        if rows[k][k] == 0:
+            swap = next((i for i in range(k + 1, n) if rows[i][k] != 0), None)
+            if swap is None:
+                return 0
+            rows[k], rows[swap] = rows[swap], rows[k]
+            sign = -sign
+
+        pivot_row = rows[k]
+        pivot = pivot_row[k]
+        for i in range(k + 1, n):
+            row = rows[i]
+            f = row[k]
+            if exact_ints:
+                rows[i] = [0] * (k + 1) + [(pivot * row[j] - f * pivot_row[j]) // prev for j in range(k + 1, n)]
+            else:
+                rows[i] = [0] * (k + 1) + [_exact_div(pivot * row[j] - f * pivot_row[j], prev) for j in range(k + 1, n)]
+        prev = pivot
+
+    return sign * rows[-1][-1]
+
+
+def _exact_div(a, b):
+    return a // b if type(a) == int and type(b) == int else a / b
+
+
+def _determinant_lu(rows):
+    # Product of the pivots of an LU decomposition with partial pivoting
+    n = len(rows)
+    det = 1.0
+    for k in range(n):
+        p = max(range(k, n), key=lambda i: abs(rows[i][k]))
+        if rows[p][k] == 0:
+            return 0.0
+        if p != k:
+            rows[k], rows[p] = rows[p], rows[k]
+            det = -det
+
+        pivot_row = rows[k]
+        pivot = pivot_row[k]
+        det *= pivot
+        for i in range(k + 1, n):
+            f = rows[i][k] / pivot
+            if f:
+                rows[i] = [a - f * b for a, b in zip(rows[i], pivot_row)]
+
+    return det
+
+
 def adjugate(M: mb.Matrix):
     return cofactors(M).transpose()
 
 
 def cofactors(M: mb.Matrix):
+    M = _as_dense(M)
     return mb.Matrix(
         [[((-1) ** (i + j)) * determinant(M.sub_matrix(i, j))
           for j in range(M.num_cols)]
@@ -224,16 +587,25 @@ def inverse(M: mb.Matrix):
         # M.num_rows, M.num_cols))
         return None
 
-    det = determinant(M)
-    if det == 0:
+    lu = _as_dense(M).lu()
+    if lu.is_singular():
         # raise ArithmeticError("Matrix has no inverse: determinant = 0")
         return None
 
-    return adjugate(M) * (1 / det)
+    inv = lu.inverse()
+    if lu.int_entries:
+        return inv * 1.0  # Integer matrices have always given float inverses
+
+    return inv
 
 
 def sort_matrix(M: mb.Matrix):
     # Roughly sorts rows of a matrix, putting 0 rows at the bottom
+    if type(M) == mb.SparseMatrix:
+        order = sorted(range(M.num_rows), key=lambda i: functools.cmp_to_key(cmp_rows)(M.row(i)))
+        M._build(M.num_rows, M.num_cols, [M.row_dict(i) for i in order])
+        return
+
     M.rows.sort(key=functools.cmp_to_key(cmp_rows))
 
 
@@ -256,6 +628,9 @@ def cmp_rows(r1, r2):
 
 
 def count_zero_rows(M: mb.Matrix):
+    if type(M) == mb.SparseMatrix:
+        return sum(1 for i in range(M.num_rows) if M.indptr[i] == M.indptr[i + 1])
+
     zeros = 0
     for row in M.rows:
         if row.count(0) == M.num_cols:
@@ -1,32 +1,143 @@
-from functools import reduce
+from itertools import repeat
+from math import gcd as _int_gcd
 
+try:
+    import numpy as np
 
+    _ndarray = np.ndarray
+except ImportError:
+    np = None
+    _ndarray = None
+
+from buffers import INT64_MAX, abs_bound, make_buffer, numpy_pair
+
+
+# LCM of any number of integers, always >= 0. Stops as soon as it reaches 0.
 def lowest_common_multiple(*args):
     if len(args) == 0:
         return 0
 
     if len(args) == 1:
-        return args[0]
+        return abs(args[0])
 
-    if len(args) == 2:
-        a, b = args[0], args[1]
-        return (a * b) // greatest_common_divisor(a, b)
+    result = 1
+    for a in args:
+        if not a:
+            return 0
+        result = abs(result // _gcd(result, a) * a)
 
-    return reduce(lowest_common_multiple, args)
+    return result
 
 
-# Euclid's algorithm. Only works for a, b > 0
+# GCD of any number of integers, always >= 0. Stops as soon as it reaches 1.
 def greatest_common_divisor(*args):
     if len(args) == 0:
         return 1
 
-    if len(args) == 1:
-        return args[0]
-
     if len(args) == 2:
-        a, b = max(args), min(args)
-        while b != 0:
-            a, b = b, a % b
-        return abs(a)
+        return _gcd(args[0], args[1])
+
+    result = 0
+    for a in args:
+        result = _gcd(result, a)
+        if result == 1:
+            break
+
+    return result
+
+
+# Returns (g, x, y) with g = gcd(a, b) >= 0 and a*x + b*y = g
+def extended_gcd(a, b):
+    x0, y0, x1, y1 = 1, 0, 0, 1
+    while b:
+        q, r = divmod(a, b)
+        a, b = b, r
+        x0, x1 = x1, x0 - q * x1
+        y0, y1 = y1, y0 - q * y1
+
+    if a < 0:
+        return -a, -x0, -y0
+    return a, x0, y0
+
+
+# x in [0, |m|) with a*x = 1 (mod m)
+def mod_inverse(a, m):
+    try:
+        return pow(a, -1, m) % abs(m)
+    except ValueError:
+        raise ValueError("{} has no inverse modulo {}".format(a, m)) from None
+
+
+# Elementwise gcd(a[i], b[i]) of two equal-length sequences, or of a sequence and a single number.
+# NumPy integer arrays are handled by np.gcd and give an ndarray; otherwise the result is a make_buffer buffer:
+# an array('q'), or a list when some value doesn't fit 64 bits.
+def gcd_many(a, b):
+    pair = numpy_pair(a, b, "i")
+    if pair is not None:
+        return np.gcd(*_same_shape(pair))
+
+    return make_buffer(map(_gcd, *_aligned(a, b)))
+
+
+# Elementwise lcm, as gcd_many. NumPy arrays whose products could overflow int64 are done in Python.
+def lcm_many(a, b):
+    pair = numpy_pair(a, b, "i")
+    if pair is not None and abs_bound(pair[0]) * abs_bound(pair[1]) <= INT64_MAX:
+        return np.lcm(*_same_shape(pair))
+
+    return make_buffer(map(lowest_common_multiple, *_aligned(a, b)))
+
+
+# Bernstein's batch gcd: for each x in nums, gcd(x, product of all the others), via a product tree and a
+# remainder tree. Entries above 1 share a factor with some other entry, in far fewer operations than
+# comparing every pair. nums must be positive.
+def batch_gcd(nums):
+    nums = [int(x) for x in nums]
+    if len(nums) < 2:
+        return make_buffer(1 for _ in nums)
+
+    tree = [nums]
+    while len(tree[-1]) > 1:
+        level = tree[-1]
+        tree.append([level[i] * level[i + 1] if i + 1 < len(level) else level[i] for i in range(0, len(level), 2)])
+
+    remainders = tree.pop()
+    while tree:
+        level = tree.pop()
+        remainders = [remainders[i // 2] % (x * x) for i, x in enumerate(level)]
+
+    return make_buffer(_int_gcd(r // x, x) for r, x in zip(remainders, nums))
+
+
+# Both operands as sequences of equal length, repeating a single number
+def _aligned(a, b):
+    if type(a) == _ndarray:
+        a = a.tolist()
+    if type(b) == _ndarray:
+        b = b.tolist()
+
+    if type(a) in (int, float):
+        a = repeat(a, len(b))
+    elif type(b) in (int, float):
+        b = repeat(b, len(a))
+    elif len(a) != len(b):
+        raise ValueError("Sequences differ in length: {} and {}".format(len(a), len(b)))
+
+    return a, b
+
+
+def _same_shape(pair):
+    if pair[0].shape != pair[1].shape and pair[0].ndim and pair[1].ndim:
+        raise ValueError("Arrays differ in shape: {} and {}".format(pair[0].shape, pair[1].shape))
+    return pair
+
+
+# Machine gcd for ints. Other number types (floats, custom fractions) use Euclid's algorithm directly.
+def _gcd(a, b):
+    if type(a) == int and type(b) == int:
+        return _int_gcd(a, b)
+
+    while b != 0:
+        a, b = b, a % b
+    return abs(a)
 
-    return reduce(greatest_common_divisor, args)
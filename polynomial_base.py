@@ -1,7 +1,18 @@
+from itertools import zip_longest
 from sys import stderr
 
 from number_functions import greatest_common_divisor as gcd
 
+# Polynomials of at least POLY_SPARSE_MIN_DEGREE with under one nonzero coefficient per POLY_SPARSE_DENSITY
+# coefficients are stored as {exponent: coefficient} instead of a dense list
+POLY_SPARSE_MIN_DEGREE = 64
+POLY_SPARSE_DENSITY = 8
+
+# Integer polynomial products use schoolbook until the shorter factor has KARATSUBA_THRESHOLD coefficients.
+# Past that, Kronecker substitution handles coefficients up to KRONECKER_MAX_BITS bits, and Karatsuba larger ones.
+KARATSUBA_THRESHOLD = 32
+KRONECKER_MAX_BITS = 1024
+
 
 # ax^p      All terms must be integers
 class Term:
@@ -239,6 +250,10 @@ class Expression:
         return self.__add__(-other)
 
     def __mul__(self, other):
+        # Integer polynomials in one variable go through Polynomial's fast multiplication
+        if _is_int_polynomial(self.terms + other.terms):
+            return (Polynomial.from_expression(self) * Polynomial.from_expression(other)).to_expression()
+
         terms = []
         for t1 in self.terms:
             for t2 in other.terms:
@@ -255,16 +270,22 @@ class Expression:
         return " ".join(list(map(str, self.terms)))
 
     def simplify(self):
-        terms = []
+        # Groups terms by exponent in one pass, then sums each group
+        groups = {}
+        for t in self.terms:
+            groups.setdefault(t.exponent, []).append(t)
 
-        for e in set(t.exponent for t in self.terms):
-            tmp_terms = [t for t in self.terms if t.exponent == e]
-            if len(tmp_terms) > 0:
-                if sum(tmp_terms) != 0:
-                    terms.append(sum(tmp_terms))
+        terms = []
+        for tmp_terms in groups.values():
+            total = sum(tmp_terms)
+            if total != 0:
+                terms.append(total)
 
         self.terms = terms
 
+    def to_polynomial(self):
+        return Polynomial.from_expression(self)
+
 
 # a^b
 class Irrational(Term):
@@ -291,3 +312,291 @@ class Irrational(Term):
 
     def __float__(self):
         return self.coefficient * self.base ** float(self.exponent)
+
+
+# Polynomial in one variable with exponents >= 0, stored as a dense coefficient list (coeffs[i] is the
+# coefficient of x^i) or, when high degree and mostly zero, as a sparse {exponent: coefficient} dict.
+# coeffs: sequence of coefficients from x^0 up, or a dict {exponent: coefficient}
+# sparse: True/False forces the storage, None picks it by density
+class Polynomial:
+    def __init__(self, coeffs=(), base="x", sparse=None):
+        self.base = base
+
+        if type(coeffs) == dict:
+            for e in coeffs:
+                if type(e) != int or e < 0:
+                    raise ValueError("Polynomial exponents must be non-negative integers: {}".format(e))
+            terms = {e: c for e, c in coeffs.items() if c != 0}
+            degree = max(terms) if terms else -1
+            nnz = len(terms)
+        else:
+            terms = list(coeffs)
+            while terms and terms[-1] == 0:
+                terms.pop()
+            degree = len(terms) - 1
+            nnz = None
+
+        if sparse is None:
+            if nnz is None and degree >= POLY_SPARSE_MIN_DEGREE:
+                nnz = sum(1 for c in terms if c != 0)
+            sparse = nnz is not None and degree >= POLY_SPARSE_MIN_DEGREE and nnz * POLY_SPARSE_DENSITY <= degree + 1
+
+        if sparse and type(terms) == list:
+            terms = {e: c for e, c in enumerate(terms) if c != 0}
+        elif not sparse and type(terms) == dict:
+            dense = [0] * (degree + 1)
+            for e, c in terms.items():
+                dense[e] = c
+            terms = dense
+
+        self._coeffs = terms
+        self.degree = degree  # -1 for the zero polynomial
+
+    @classmethod
+    def from_expression(cls, expression, sparse=None):
+        return cls._from_terms(expression.terms, sparse)
+
+    @classmethod
+    def from_term(cls, term, sparse=None):
+        return cls._from_terms([term], sparse)
+
+    @classmethod
+    def _from_terms(cls, terms, sparse):
+        bases = {t.base for t in terms if t.exponent != 0}
+        if len(bases) > 1:
+            raise ValueError("Polynomial terms must share one variable: {}".format(", ".join(map(str, bases))))
+
+        coeffs = {}
+        for t in terms:
+            if type(t.exponent) != int or t.exponent < 0:
+                raise ValueError("Polynomial exponents must be non-negative integers: {}".format(t))
+            coeffs[t.exponent] = coeffs.get(t.exponent, 0) + t.coefficient
+
+        return cls(coeffs, bases.pop() if bases else "x", sparse)
+
+    def to_expression(self):
+        return Expression(*[Term(c, self.base, e) for e, c in self.items()])
+
+    @property
+    def sparse(self):
+        return type(self._coeffs) == dict
+
+    # Nonzero (exponent, coefficient) pairs, lowest exponent first
+    def items(self):
+        if self.sparse:
+            return sorted(self._coeffs.items())
+        return [(e, c) for e, c in enumerate(self._coeffs) if c != 0]
+
+    # Dense coefficient list, x^0 first
+    def coefficients(self):
+        if self.sparse:
+            return Polynomial(self._coeffs, self.base, sparse=False)._coeffs
+        return list(self._coeffs)
+
+    def __getitem__(self, exponent):
+        if self.sparse:
+            return self._coeffs.get(exponent, 0)
+        return self._coeffs[exponent] if 0 <= exponent <= self.degree else 0
+
+    def __add__(self, other):
+        other = self._coerce(other)
+        if other is None:
+            return NotImplemented
+
+        if self.sparse or other.sparse:
+            terms = dict(self._terms())
+            for e, c in other._terms():
+                terms[e] = terms.get(e, 0) + c
+            return Polynomial(terms, self._base_with(other))
+
+        return Polynomial([a + b for a, b in zip_longest(self._coeffs, other._coeffs, fillvalue=0)],
+                          self._base_with(other))
+
+    def __radd__(self, other):
+        return self + other
+
+    def __sub__(self, other):
+        other = self._coerce(other)
+        if other is None:
+            return NotImplemented
+        return self + -other
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __neg__(self):
+        if self.sparse:
+            return Polynomial({e: -c for e, c in self._coeffs.items()}, self.base)
+        return Polynomial([-c for c in self._coeffs], self.base)
+
+    def __mul__(self, other):
+        if _is_scalar(other):
+            if self.sparse:
+                return Polynomial({e: c * other for e, c in self._coeffs.items()}, self.base)
+            return Polynomial([c * other for c in self._coeffs], self.base)
+
+        other = self._coerce(other)
+        if other is None:
+            return NotImplemented
+
+        if self.sparse or other.sparse:
+            terms = {}
+            for e1, c1 in self._terms():
+                for e2, c2 in other._terms():
+                    terms[e1 + e2] = terms.get(e1 + e2, 0) + c1 * c2
+            return Polynomial(terms, self._base_with(other))
+
+        return Polynomial(_mul_dense(self._coeffs, other._coeffs), self._base_with(other))
+
+    def __rmul__(self, other):
+        return self * other
+
+    # Evaluates at x: Horner's rule when dense, powers of the gaps between exponents when sparse
+    def __call__(self, x):
+        if not self.sparse:
+            result = 0
+            for c in reversed(self._coeffs):
+                result = result * x + c
+            return result
+
+        result = 0
+        prev = self.degree
+        for e, c in sorted(self._coeffs.items(), reverse=True):
+            result = result * x ** (prev - e) + c
+            prev = e
+        return result * x ** prev if prev > 0 else result
+
+    def derivative(self):
+        if self.sparse:
+            return Polynomial({e - 1: e * c for e, c in self._coeffs.items() if e}, self.base)
+        return Polynomial([e * c for e, c in enumerate(self._coeffs)][1:], self.base)
+
+    def __eq__(self, other):
+        try:
+            other = self._coerce(other)
+        except (ArithmeticError, ValueError):
+            return False  # Another variable, or not a polynomial in one variable at all
+        if other is None:
+            return NotImplemented
+        return self.items() == other.items()
+
+    def __repr__(self):
+        return str(self.to_expression()) if self.degree >= 0 else "0"
+
+    # (exponent, coefficient) pairs, zeros included for dense storage
+    def _terms(self):
+        return self._coeffs.items() if self.sparse else enumerate(self._coeffs)
+
+    # other as a Polynomial in the same variable, or None if it can't be one
+    def _coerce(self, other):
+        if _is_scalar(other):
+            other = Polynomial([other], self.base)
+        elif type(other) in [Term, *Term.__subclasses__()]:
+            other = Polynomial.from_term(other)
+        elif type(other) == Expression:
+            other = Polynomial.from_expression(other)
+        elif type(other) != Polynomial:
+            return None
+
+        if other.base != self.base and other.degree > 0 and self.degree > 0:
+            raise ArithmeticError("Can't combine polynomials in differing variables: {}, {}".format(self, other))
+        return other
+
+    # Variable of a result of self and other: a constant takes the other operand's variable
+    def _base_with(self, other):
+        return self.base if self.degree > 0 or other.degree <= 0 else other.base
+
+
+# True if terms are integer coefficients times non-negative integer powers of a single variable
+def _is_int_polynomial(terms):
+    return len({t.base for t in terms}) <= 1 and all(
+        type(t.coefficient) == int and type(t.exponent) == int and t.exponent >= 0 for t in terms)
+
+
+def _is_scalar(x):
+    return type(x) in (int, float, Fraction)
+
+
+# Product of dense coefficient lists. Integer polynomials pick schoolbook, Kronecker substitution or Karatsuba
+# by length and coefficient size (KARATSUBA_THRESHOLD, KRONECKER_MAX_BITS); other coefficients use schoolbook.
+# All are exact.
+def _mul_dense(a, b):
+    if not a or not b:
+        return []
+
+    if len(a) < len(b):
+        a, b = b, a
+
+    if len(b) < KARATSUBA_THRESHOLD or not all(type(c) == int for c in a) or not all(type(c) == int for c in b):
+        return _mul_schoolbook(a, b)
+
+    if max(max(map(abs, a)), max(map(abs, b))).bit_length() <= KRONECKER_MAX_BITS:
+        return _mul_kronecker(a, b)
+
+    return _mul_karatsuba(a, b)
+
+
+# One shifted row of products per coefficient of a
+def _mul_schoolbook(a, b):
+    out = [0] * (len(a) + len(b) - 1)
+    lb = len(b)
+    for i, x in enumerate(a):
+        if x:
+            out[i:i + lb] = [o + x * y for o, y in zip(out[i:i + lb], b)]
+    return out
+
+
+# Karatsuba: (a0 + a1 x^m)(b0 + b1 x^m) from three half-size products, with
+# a0 b1 + a1 b0 = (a0 + a1)(b0 + b1) - a0 b0 - a1 b1. Needs len(a) >= len(b).
+def _mul_karatsuba(a, b):
+    if len(b) < KARATSUBA_THRESHOLD:
+        return _mul_schoolbook(a, b)
+
+    m = len(a) // 2
+    if len(b) <= m:
+        # Unbalanced: split only a, and recurse on the two halves
+        return _add_shifted(_mul_karatsuba(a[:m], b), _mul_karatsuba(a[m:], b) if len(a) - m >= len(b) else
+                            _mul_karatsuba(b, a[m:]), m)
+
+    a0, a1, b0, b1 = a[:m], a[m:], b[:m], b[m:]
+    z0 = _mul_karatsuba(a0, b0)
+    z2 = _mul_karatsuba(a1, b1) if len(a1) >= len(b1) else _mul_karatsuba(b1, a1)
+    z1 = _mul_karatsuba(_add_lists(a1, a0), _add_lists(b0, b1))
+    z1 = [c - d - e for c, d, e in zip_longest(z1, z0, z2, fillvalue=0)]
+
+    return _add_shifted(_add_shifted(z0, z1, m), z2, 2 * m)
+
+
+def _add_lists(a, b):
+    return [x + y for x, y in zip_longest(a, b, fillvalue=0)]
+
+
+# a + b * x^shift
+def _add_shifted(a, b, shift):
+    out = a + [0] * max(0, shift + len(b) - len(a))
+    out[shift:shift + len(b)] = [x + y for x, y in zip(out[shift:shift + len(b)], b)]
+    return out
+
+
+# Kronecker substitution: packs each integer polynomial into one big int, evaluating it at 2^k with k wide
+# enough that no coefficient of the product overflows its slot, multiplies once, and unpacks the slots.
+# Signs are handled by packing positive and negative parts separately and offsetting every slot of the
+# product by 2^(k-1) before reading it back.
+def _mul_kronecker(a, b):
+    bound = max(map(abs, a)) * max(map(abs, b)) * len(b)
+    if not bound:
+        return [0] * (len(a) + len(b) - 1)
+
+    width = (bound.bit_length() + 8) // 8  # Bytes per slot, with a spare bit for the sign
+    product = _kronecker_pack(a, width) * _kronecker_pack(b, width)
+
+    n = len(a) + len(b) - 1
+    half = 1 << (8 * width - 1)
+    packed = (product + int.from_bytes(half.to_bytes(width, "little") * n, "little")).to_bytes(n * width, "little")
+    return [int.from_bytes(packed[i:i + width], "little") - half for i in range(0, n * width, width)]
+
+
+def _kronecker_pack(coeffs, width):
+    positive = b"".join(max(c, 0).to_bytes(width, "little") for c in coeffs)
+    negative = b"".join(max(-c, 0).to_bytes(width, "little") for c in coeffs)
+    return int.from_bytes(positive, "little") - int.from_bytes(negative, "little")
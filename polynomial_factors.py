@@ -1,24 +1,25 @@
 import parser
 import tokenize
 from io import StringIO
-from math import sqrt
 
 from number_functions import greatest_common_divisor as gcd
 from polynomial_base import Term
+from primes import factorize
 
 
 # TODO: gcd of Terms eg. x^4, x^3   -> x^3
 
 
+# Positive and negative divisors of n, built from its prime factorization
 def get_divisors(n):
-    divisors = set()
-    for i in range(1, int(sqrt(abs(n)) + 1)):
-        if n % i == 0:
-            divisors.update([i, n // i])  # Positive divisors
+    if n == 0:
+        return set()
 
-    divisors.update([-x for x in divisors])  # Negative divisors
+    divisors = [1]
+    for p, e in factorize(abs(n)).items():
+        divisors = [d * p ** k for d in divisors for k in range(e + 1)]  # Positive divisors
 
-    return divisors
+    return set(divisors) | {-d for d in divisors}  # Negative divisors
 
 
 # gcd of Terms
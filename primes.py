@@ -1,28 +1,487 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress, repeat
+from math import gcd, isqrt
+from random import randrange
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from buffers import make_buffer
+
+# Odd numbers covered by one sieve segment, i.e. the segment's bytearray size.
+# 2^18 bytes keeps the working set in L2 cache while amortizing the per-segment loop over the base primes.
+SIEVE_SEGMENT_SIZE = 1 << 18
+
+# generate_primes and count_primes only use a process pool above this bound, splitting the range into
+# PARALLEL_SIEVE_CHUNKS_PER_WORKER chunks per worker so uneven chunks still balance out.
+PARALLEL_SIEVE_THRESHOLD = 1 << 24
+PARALLEL_SIEVE_CHUNKS_PER_WORKER = 4
+
+# Cap on the process-wide prime cache used by iter_primes and prime_factors (8 bytes per prime)
+PRIME_CACHE_MAX_ENTRIES = 1 << 22
+PRIME_CACHE_MIN_BOUND = 1 << 16
+
+# factorize trial-divides by primes up to this bound before switching to Miller-Rabin and Pollard-Brent rho
+TRIAL_DIVISION_BOUND = 1 << 12
+
+# Miller-Rabin with these bases is deterministic below MR_DETERMINISTIC_BOUND (about 3.3 * 10^24, so all 64-bit
+# inputs); above it MR_EXTRA_ROUNDS random bases are added.
+MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+MR_DETERMINISTIC_BOUND = 3317044064679887385961981
+MR_EXTRA_ROUNDS = 16
+
+# The shared smallest-prime-factor table grows on demand up to SPF_TABLE_MAX_BOUND (4 bytes per entry).
+# A batch only builds or grows it if it holds at least one number per SPF_TABLE_DENSITY entries needed.
+SPF_TABLE_MAX_BOUND = 1 << 25
+SPF_TABLE_DENSITY = 64
+
+_prime_cache = array("q")
+_prime_cache_bound = 2  # Every prime below this is in _prime_cache
+_spf_table = array("I")
+
+
 # Generates primes up to and including given max. Sieve method.
-def generate_primes(max_bound):
+def generate_primes(max_bound, segment_size=None, workers=1):
+    if segment_size is None and max_bound < _prime_cache_bound:
+        return _prime_cache[:bisect_right(_prime_cache, max_bound)].tolist()
+
+    if workers > 1 and max_bound >= PARALLEL_SIEVE_THRESHOLD:
+        primes = [2]
+        for chunk in _parallel_sieve(_sieve_chunk, max_bound + 1, segment_size, workers):
+            primes.extend(chunk)
+        return primes
+
+    return primes_in_range(2, max_bound + 1, segment_size)
+
+
+# Number of primes up to and including bound, counted segment by segment without keeping the primes
+def count_primes(bound, segment_size=None, workers=1):
+    if segment_size is None and bound < _prime_cache_bound:
+        return bisect_right(_prime_cache, bound)
+
+    if bound < 2:
+        return 0
+
+    if workers > 1 and bound >= PARALLEL_SIEVE_THRESHOLD:
+        return 1 + sum(_parallel_sieve(_count_chunk, bound + 1, segment_size, workers))
+
+    return 1 + sum(segment.count(1) for _, segment in _odd_segments(3, bound + 1, segment_size))
+
+
+# Primes p with lo <= p < hi, sieving only that range (plus the base primes up to sqrt(hi)).
+def primes_in_range(lo, hi, segment_size=None):
     primes = []
-    nums = [True] * (max_bound + 1)
+    for segment in _sieve_segments(lo, hi, segment_size):
+        primes.extend(segment)
+    return primes
+
+
+# Yields the primes in [lo, hi) as one list per segment.
+def _sieve_segments(lo, hi, segment_size=None):
+    if lo <= 2 < hi:
+        yield [2]
+
+    for start, segment in _odd_segments(lo, hi, segment_size):
+        yield list(compress(range(start, start + 2 * len(segment), 2), segment))
+
+
+# Yields (start, flags) for consecutive segments of the odd numbers in [lo, hi), where flags[i] is 1 when
+# start + 2i is prime. Each segment is a bytearray; multiples are crossed off by slice assignment.
+# The default segment size grows with the number of base primes so the per-segment loop over them stays
+# small next to the crossing off itself.
+def _odd_segments(lo, hi, segment_size=None, base_primes=None):
+    if hi <= 3:
+        return
+
+    if base_primes is None:
+        base_primes = _primes_up_to(isqrt(hi - 1))
+    base_primes = base_primes[1:bisect_right(base_primes, isqrt(hi - 1))]  # Odd primes up to sqrt(hi - 1)
+
+    size = segment_size or max(SIEVE_SEGMENT_SIZE, 64 * len(base_primes))
+    if size < 1:
+        raise ValueError("Segment size must be positive: {}".format(size))
+
+    start = max(lo, 1) | 1  # First odd number in range
+    while start < hi:
+        count = min(size, (hi - start + 1) // 2)
+        end = start + 2 * count  # Segment covers the odd numbers start, start + 2, ..., end - 2
+        segment = bytearray([1]) * count
+        if start == 1:
+            segment[0] = 0
+
+        for p in base_primes:
+            m = p * p
+            if m >= end:
+                break
+            if m < start:
+                m = start + (-start) % p
+                if not m & 1:
+                    m += p
+            i = (m - start) // 2
+            segment[i::p] = bytes(len(range(i, count, p)))
 
-    for i in range(2, max_bound + 1):
-        if nums[i]:
-            primes.append(i)
-            for k in range(i, max_bound + 1, i):
-                nums[k] = False
+        yield start, segment
+        start = end
 
+
+# Splits [3, hi) into chunks run by task over a process pool, returning the results in order.
+# The base primes are sieved once here and handed to each worker process as it starts.
+def _parallel_sieve(task, hi, segment_size, workers):
+    base_primes = _primes_up_to(isqrt(hi - 1))
+    step = -(-hi // (workers * PARALLEL_SIEVE_CHUNKS_PER_WORKER))
+    starts = range(3, hi, step)
+
+    with ProcessPoolExecutor(workers, initializer=_set_worker_base_primes, initargs=(base_primes,)) as pool:
+        return list(pool.map(task, starts, [min(lo + step, hi) for lo in starts], repeat(segment_size)))
+
+
+_worker_base_primes = None
+
+
+def _set_worker_base_primes(base_primes):
+    global _worker_base_primes
+    _worker_base_primes = base_primes
+
+
+# Process pool tasks, at module level so workers can unpickle them
+def _sieve_chunk(lo, hi, segment_size):
+    primes = []
+    for start, segment in _odd_segments(lo, hi, segment_size, _worker_base_primes):
+        primes.extend(compress(range(start, start + 2 * len(segment), 2), segment))
     return primes
 
 
-# Returns prime factors of a given number.
+def _count_chunk(lo, hi, segment_size):
+    return sum(segment.count(1) for _, segment in _odd_segments(lo, hi, segment_size, _worker_base_primes))
+
+
+# Yields primes >= start without end.
+# Primes are served from (and added to) the shared cache until it reaches PRIME_CACHE_MAX_ENTRIES,
+# after which sieving continues in windows that aren't kept.
+def iter_primes(start=2):
+    if start <= 2 * max(_prime_cache_bound, PRIME_CACHE_MIN_BOUND):
+        _extend_prime_cache(start + 1)
+        i = bisect_left(_prime_cache, start)
+        while True:
+            while i < len(_prime_cache):
+                yield _prime_cache[i]
+                i += 1
+            if not _extend_prime_cache(2 * _prime_cache_bound):
+                break
+        start = max(start, _prime_cache_bound)
+
+    lo = start
+    while True:
+        hi = 2 * max(lo, SIEVE_SEGMENT_SIZE)
+        for segment in _sieve_segments(lo, hi):
+            yield from segment
+        lo = hi
+
+
+# Sieves the cache up to at least bound, growing it geometrically.
+# Returns False once the cache is full and can't cover bound.
+def _extend_prime_cache(bound):
+    global _prime_cache_bound
+    if bound <= _prime_cache_bound:
+        return True
+    if len(_prime_cache) >= PRIME_CACHE_MAX_ENTRIES:
+        return False
+
+    hi = max(bound, 2 * _prime_cache_bound, PRIME_CACHE_MIN_BOUND)
+    for segment in _sieve_segments(_prime_cache_bound, hi):
+        room = PRIME_CACHE_MAX_ENTRIES - len(_prime_cache)
+        if len(segment) > room:
+            _prime_cache.extend(segment[:room])
+            _prime_cache_bound = _prime_cache[-1] + 1
+            return bound <= _prime_cache_bound
+        _prime_cache.extend(segment)
+
+    _prime_cache_bound = hi
+    return True
+
+
+# Frees the shared prime cache and smallest-prime-factor table
+def clear_prime_cache():
+    global _prime_cache, _prime_cache_bound, _spf_table
+    _prime_cache = array("q")
+    _prime_cache_bound = 2
+    _spf_table = array("I")
+
+
+# Primes up to and including bound, from the cache when it covers them
+def _primes_up_to(bound):
+    if bound < _prime_cache_bound:
+        return _prime_cache[:bisect_right(_prime_cache, bound)].tolist()
+    return _small_primes(bound)
+
+
+# Unsegmented odd-only sieve for the base primes. Index i stands for 2i + 1.
+def _small_primes(bound):
+    if bound < 2:
+        return []
+
+    sieve = bytearray([1]) * ((bound + 1) // 2)
+    sieve[0] = 0
+    for i in range(1, (isqrt(bound) + 1) // 2):
+        if sieve[i]:
+            p = 2 * i + 1
+            j = p * p // 2
+            sieve[j::p] = bytes(len(range(j, len(sieve), p)))
+
+    return [2, *compress(range(1, bound + 1, 2), sieve)]
+
+
+# Returns prime factors of a given number, with repeats, in increasing order.
 def prime_factors(num):
-    primes = generate_primes(num)
-    factors = []
-
-    prime_index = 0
-    while num > 1:
-        if num % primes[prime_index] == 0:
-            factors.append(primes[prime_index])
-            num /= primes[prime_index]
+    return [p for p, e in sorted(factorize(num).items()) for _ in range(e)]
+
+
+# Prime factorization as a {prime: exponent} dict. Numbers below 2 give {}.
+# Small factors come from trial division by cached primes, larger ones from Pollard-Brent rho.
+def factorize(num):
+    if type(num) != int:
+        raise TypeError("Can only factorize integers: {}".format(num))
+
+    if 1 < num < len(_spf_table):
+        return _factorize_spf(num, _spf_table)
+
+    factors = {}
+    for p in _trial_primes():
+        if p > TRIAL_DIVISION_BOUND or p * p > num:
+            break
+        if num % p == 0:
+            e = 0
+            while num % p == 0:
+                num //= p
+                e += 1
+            factors[p] = e
+
+    pending = [num] if num > 1 else []
+    while pending:
+        n = pending.pop()
+        if n < TRIAL_DIVISION_BOUND ** 2 or is_prime(n):  # No factors up to the bound are left
+            factors[n] = factors.get(n, 0) + 1
         else:
-            prime_index += 1
+            d = _pollard_brent(n)
+            pending += [d, n // d]
+
+    return factors
+
+
+# Miller-Rabin primality test. Deterministic below MR_DETERMINISTIC_BOUND, probabilistic above it.
+def is_prime(n):
+    if n < 2:
+        return False
+    for p in MR_BASES:
+        if n % p == 0:
+            return n == p
+
+    d, s = n - 1, 0
+    while not d & 1:
+        d >>= 1
+        s += 1
+
+    bases = MR_BASES
+    if n >= MR_DETERMINISTIC_BOUND:
+        bases += tuple(randrange(2, n - 1) for _ in range(MR_EXTRA_ROUNDS))
+
+    for a in bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+
+    return True
+
+
+# Returns a nontrivial factor of the odd composite n (Brent's variant of Pollard's rho).
+# Differences are multiplied together in batches of m so only one gcd is taken per batch.
+def _pollard_brent(n, m=128):
+    while True:
+        y, c = randrange(1, n), randrange(1, n)
+        g = r = q = 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += m
+            r *= 2
+
+        if g == n:
+            # The batch overshot; step through it one gcd at a time
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+
+        if g != n:
+            return g
+
+
+# Primes for trial division, from the cache unless it is capped below TRIAL_DIVISION_BOUND
+def _trial_primes():
+    if _extend_prime_cache(TRIAL_DIVISION_BOUND + 1):
+        return _prime_cache
+    return _small_primes(TRIAL_DIVISION_BOUND)
+
+
+# Table t where t[n] is the smallest prime factor of composite n <= bound, and 0 for 0, 1 and primes.
+# backend: "python" for an array('I'), "numpy" for a uint32 ndarray, or None to build with numpy when installed.
+def smallest_prime_factors(bound, backend=None):
+    if backend is None:
+        backend = "python" if np is None else "numpy"
+        if backend == "numpy":
+            return array("I", smallest_prime_factors(bound, "numpy").astype(np.uintc).tobytes())
+
+    # Largest base prime first, so each composite ends up holding its smallest prime factor
+    base_primes = _primes_up_to(isqrt(bound))[::-1]
+
+    if backend == "numpy":
+        if np is None:
+            raise ImportError("The numpy backend requires numpy to be installed")
+
+        table = np.zeros(bound + 1, dtype=np.uint32)
+        for p in base_primes:
+            table[p * p::p] = p
+        return table
+
+    if backend == "python":
+        table = array("I", [0]) * (bound + 1)
+        for p in base_primes:
+            j = p * p
+            table[j::p] = array("I", [p]) * len(range(j, bound + 1, p))
+        return table
+
+    raise ValueError("Unknown backend: {}".format(backend))
+
+
+# Factorizations of each number in nums as {prime: exponent} dicts, in order.
+# Batches of small numbers are factored by walking the shared smallest-prime-factor table.
+def factor_many(nums):
+    nums = list(nums)
+    if nums:
+        _grow_spf_table(max(nums), len(nums))
+
+    return [factorize(n) for n in nums]
+
+
+# Multiplicative functions of a positive integer n:
+# number of divisors, sum of divisors, Euler's totient, and Mobius (0 if a prime divides n twice,
+# otherwise -1 to the number of prime factors)
+def divisor_count(n):
+    return _divisor_count(_positive_factors(n))
+
+
+def divisor_sum(n):
+    return _divisor_sum(_positive_factors(n))
+
+
+def euler_phi(n):
+    return _euler_phi(_positive_factors(n))
+
+
+def mobius(n):
+    return _mobius(_positive_factors(n))
+
+
+# The same functions for every lo <= n < hi, indexed by n - lo: an array('q'), or a list once a value
+# doesn't fit 64 bits
+def divisor_count_range(lo, hi):
+    return _range_values(_divisor_count, lo, hi)
+
+
+def divisor_sum_range(lo, hi):
+    return _range_values(_divisor_sum, lo, hi)
+
+
+def euler_phi_range(lo, hi):
+    return _range_values(_euler_phi, lo, hi)
+
+
+def mobius_range(lo, hi):
+    return _range_values(_mobius, lo, hi)
+
+
+def _positive_factors(n):
+    if n < 1:
+        raise ValueError("Expected a positive integer: {}".format(n))
+    return factorize(n)
+
+
+def _range_values(f, lo, hi):
+    if lo < 1:
+        raise ValueError("Range must start at a positive integer: {}".format(lo))
+
+    if lo >= hi:
+        return array("q")
+
+    _grow_spf_table(hi - 1, hi - lo)
+    if hi <= len(_spf_table):
+        table = _spf_table
+        return make_buffer([f(_factorize_spf(n, table)) for n in range(lo, hi)])
+    return make_buffer([f(factorize(n)) for n in range(lo, hi)])
+
+
+def _divisor_count(factors):
+    count = 1
+    for e in factors.values():
+        count *= e + 1
+    return count
+
+
+def _divisor_sum(factors):
+    total = 1
+    for p, e in factors.items():
+        total *= (p ** (e + 1) - 1) // (p - 1)
+    return total
+
+
+def _euler_phi(factors):
+    phi = 1
+    for p, e in factors.items():
+        phi *= (p - 1) * p ** (e - 1)
+    return phi
+
+
+def _mobius(factors):
+    if any(e > 1 for e in factors.values()):
+        return 0
+    return -1 if len(factors) % 2 else 1
+
+
+# Builds the shared table up to bound if the batch of count numbers is dense enough to pay for it
+def _grow_spf_table(bound, count):
+    global _spf_table
+    if bound < len(_spf_table) or bound > SPF_TABLE_MAX_BOUND or count * SPF_TABLE_DENSITY < bound:
+        return
+
+    _spf_table = smallest_prime_factors(min(max(bound, 2 * len(_spf_table)), SPF_TABLE_MAX_BOUND))
+
 
+# Factorization of 1 < n < len(table) by repeatedly dividing out its smallest prime factor
+def _factorize_spf(n, table):
+    factors = {}
+    while n > 1:
+        p = table[n] or n
+        e = 0
+        while n % p == 0:
+            n //= p
+            e += 1
+        factors[p] = e
     return factors
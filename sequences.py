@@ -1,8 +1,270 @@
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import count, islice, takewhile
+
+import matrix_base as mb
+from number_functions import lowest_common_multiple
+from primes import factorize, iter_primes
+
+LAZY_SEQUENCE_CACHE_MAX = 1 << 20  # Default cap on the terms a LazySequence memoizes
+LAZY_SEQUENCE_CHUNK = 64  # Terms computed at a time while iterating
+
+
+# Sequence whose terms are computed on demand and memoized in a compact array (a list once a term
+# doesn't fit 64 bits), so terms already computed are O(1) lookups.
+# terms: callable returning an iterator over the whole sequence from index 0
+# term: optional callable giving the i-th term directly, used past the cache cap
+# cache_max: most terms kept, LAZY_SEQUENCE_CACHE_MAX by default
+class LazySequence:
+    def __init__(self, terms, term=None, cache_max=None):
+        self._terms = terms
+        self._term = term
+        self.cache_max = LAZY_SEQUENCE_CACHE_MAX if cache_max is None else cache_max
+        self._cache = array("q")
+        self._source = None  # Iterator positioned just past the cached terms
+        self._exhausted = False
+
+    # Sequence of f(0), f(1), ...
+    @classmethod
+    def from_function(cls, f, cache_max=None):
+        return cls(lambda: map(f, count()), f, cache_max)
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            return self._slice(i)
+
+        if i < 0:
+            raise IndexError("LazySequence indices must be non-negative: {}".format(i))
+
+        if i < len(self._cache):
+            return self._cache[i]
+
+        if self._term is not None and i >= self.cache_max:
+            return self._term(i)
+
+        if self._fill(i + 1):
+            return self._cache[i]
+
+        for v in islice(self._terms(), i, None):
+            return v
+        raise IndexError("LazySequence index out of range: {}".format(i))
+
+    def __iter__(self):
+        i = 0
+        while i < len(self._cache) or self._fill(i + LAZY_SEQUENCE_CHUNK) or i < len(self._cache):
+            yield self._cache[i]
+            i += 1
+
+        if not self._exhausted:
+            # Past the cache cap the terms are generated again, without being kept
+            yield from islice(self._terms(), i, None)
+
+    # Terms <= bound, for non-decreasing sequences
+    def up_to(self, bound):
+        n = 1
+        while self._fill(n):
+            if self._cache[n - 1] > bound:
+                return list(self._cache[:bisect_right(self._cache, bound, 0, n)])
+            n *= 2
+
+        if self._exhausted:
+            return list(self._cache[:bisect_right(self._cache, bound)])
+        return list(takewhile(lambda v: v <= bound, self))
+
+    @property
+    def num_cached(self):
+        return len(self._cache)
+
+    def _slice(self, s):
+        start, stop, step = s.start or 0, s.stop, s.step or 1
+        if start < 0 or step < 0 or stop is not None and stop < 0:
+            raise IndexError("LazySequence slices must be non-negative: {}".format(s))
+
+        if stop is not None and self._fill(stop):
+            return list(self._cache[start:stop:step])
+        return list(islice(self, start, stop, step))
+
+    # Computes terms until n are cached, or the cap or the end of the sequence is reached.
+    # Returns whether n terms are cached.
+    def _fill(self, n):
+        target = min(n, self.cache_max)
+        if len(self._cache) < target and not self._exhausted:
+            if self._source is None:
+                self._source = iter(self._terms())
+
+            for v in islice(self._source, target - len(self._cache)):
+                try:
+                    self._cache.append(v)
+                except (OverflowError, TypeError):
+                    self._cache = self._cache.tolist()
+                    self._cache.append(v)
+
+            if len(self._cache) < target:
+                self._exhausted = True
+
+        return len(self._cache) >= n
+
+
 # Generates fibonacci sequence up to a given length
 def fibonacci(length):
-    fib = [1, 1]
+    return FIBONACCI[:max(length, 2)]
+
+
+# Yields the fibonacci sequence without end, starting 1, 1, 2, ... like fibonacci()
+def iter_fibonacci():
+    a, b = 1, 1
+    while True:
+        yield a
+        a, b = b, a + b
+
+
+# n-th fibonacci number, F(0) = 0, F(1) = F(2) = 1 (so fibonacci(length)[i] == fib(i + 1)).
+# Fast doubling: O(log n) big int multiplications.
+def fib(n):
+    return _fib_pair(n)[0]
+
+
+# F(n) mod m. n is first reduced modulo a multiple of the Pisano period of m, the period of F mod m.
+def fib_mod(n, m):
+    if m < 1:
+        raise ValueError("Modulus must be positive: {}".format(m))
+
+    if n >= 0:
+        n %= _pisano_multiple(m)
+    return _fib_pair(n, m)[0]
+
+
+# Smallest p > 0 with F(n + p) = F(n) (mod m) for all n
+def pisano_period(m):
+    if m < 1:
+        raise ValueError("Modulus must be positive: {}".format(m))
+
+    # Periods are exactly the multiples of the Pisano period, so strip prime factors while one remains
+    period = _pisano_multiple(m)
+    for q in factorize(period):
+        while period % q == 0 and _fib_pair(period // q, m) == (0, 1 % m):
+            period //= q
+
+    return period
+
+
+# n-th term of a_i = coeffs[0] * a_(i-1) + ... + coeffs[k-1] * a_(i-k), given initial = [a_0, ..., a_(k-1)].
+# method: "kitamasa" reduces x^n modulo the characteristic polynomial in O(k^2 log n),
+# "matrix" raises the k x k companion matrix to the n-th power in O(k^3 log n).
+# With mod, every step is reduced mod `mod` and the result is a_n mod `mod`.
+def linear_recurrence(coeffs, initial, n, mod=None, method="kitamasa"):
+    k = len(coeffs)
+    if k == 0 or len(initial) != k:
+        raise ValueError("Need as many initial terms as coefficients, got {} and {}".format(len(initial), k))
+    if n < 0:
+        raise ValueError("Term index must be non-negative: {}".format(n))
+
+    if n < k:
+        return initial[n] % mod if mod else initial[n]
+
+    if method == "kitamasa":
+        weights = _kitamasa(coeffs, n, mod)
+    elif method == "matrix":
+        # Companion matrix maps (a_(i+k-1), ..., a_i) to (a_(i+k), ..., a_(i+1)); a_n is the last entry of
+        # M^n (a_(k-1), ..., a_0)
+        companion = mb.Matrix([list(coeffs)] + [[int(i == j) for j in range(k)] for i in range(k - 1)])
+        weights = pow(companion, n, mod).row(k - 1)[::-1]
+    else:
+        raise ValueError("Unknown method: {}".format(method))
+
+    total = sum(w * a for w, a in zip(weights, initial))
+    return total % mod if mod else total
+
+
+# (F(n), F(n + 1)), optionally mod m, from the doubling identities
+# F(2k) = F(k) * (2F(k + 1) - F(k)) and F(2k + 1) = F(k)^2 + F(k + 1)^2
+def _fib_pair(n, m=None):
+    if n < 0:
+        raise ValueError("Fibonacci index must be non-negative: {}".format(n))
+
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        c = a * (2 * b - a)
+        d = a * a + b * b
+        a, b = (d, c + d) if bit == "1" else (c, d)
+        if m:
+            a, b = a % m, b % m
+
+    return (a % m, b % m) if m else (a, b)
+
+
+# A multiple of the Pisano period of m: the lcm over prime powers p^k dividing m of p^(k-1) times
+# 3 for p = 2, 20 for p = 5, p - 1 when p = +-1 (mod 5), and 2(p + 1) otherwise
+@lru_cache(maxsize=256)
+def _pisano_multiple(m):
+    multiples = []
+    for p, e in factorize(m).items():
+        if p == 2:
+            base = 3
+        elif p == 5:
+            base = 20
+        elif p % 5 in (1, 4):
+            base = p - 1
+        else:
+            base = 2 * (p + 1)
+        multiples.append(base * p ** (e - 1))
+
+    return lowest_common_multiple(*multiples) if multiples else 1
+
+
+# Coefficients w with x^n = sum(w[i] * x^i) modulo the characteristic polynomial
+# x^k - coeffs[0] * x^(k-1) - ... - coeffs[k-1], by binary exponentiation of x
+def _kitamasa(coeffs, n, mod):
+    k = len(coeffs)
+
+    def mul(p, q):
+        prod = [0] * (2 * k - 1)
+        for i, a in enumerate(p):
+            if a:
+                for j, b in enumerate(q):
+                    prod[i + j] += a * b
+
+        # x^d = coeffs[0] * x^(d-1) + ... + coeffs[k-1] * x^(d-k), from the top degree down
+        for d in range(2 * k - 2, k - 1, -1):
+            t = prod[d]
+            if t:
+                for j, c in enumerate(coeffs, 1):
+                    prod[d - j] += t * c
+
+        return [e % mod for e in prod[:k]] if mod else prod[:k]
+
+    result = [1] + [0] * (k - 1)
+    base = [0, 1] + [0] * (k - 2) if k > 1 else [coeffs[0]]
+    while n:
+        if n & 1:
+            result = mul(result, base)
+        n >>= 1
+        if n:
+            base = mul(base, base)
+
+    return result
+
+
+# s-gonal numbers P(s, n) = ((s - 2) * n^2 - (s - 4) * n) / 2 for n = 0, 1, ...
+def figurate_numbers(sides, cache_max=None):
+    return LazySequence.from_function(lambda n: ((sides - 2) * n * n - (sides - 4) * n) // 2, cache_max)
+
+
+# The recurrence of linear_recurrence as a LazySequence, stepping term by term while iterating
+def recurrence_sequence(coeffs, initial, mod=None, cache_max=None):
+    def terms():
+        window = list(initial)
+        yield from (a % mod if mod else a for a in window)
+        while True:
+            a = sum(c * w for c, w in zip(coeffs, reversed(window)))
+            if mod:
+                a %= mod
+            yield a
+            window = window[1:] + [a]
+
+    return LazySequence(terms, lambda n: linear_recurrence(coeffs, initial, n, mod), cache_max)
 
-    while len(fib) < length:
-        fib.append(fib[-1] + fib[-2])
 
-    return fib
+FIBONACCI = LazySequence(iter_fibonacci, lambda i: fib(i + 1), cache_max=10000)  # FIBONACCI[i] == fib(i + 1)
+PRIMES = LazySequence(iter_primes)  # PRIMES.up_to(n) == generate_primes(n)